@@ -0,0 +1,54 @@
+# Copyright 2015-2025 grafana-dashboard-builder contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import annotations
+
+import os
+import pickle
+from pathlib import Path
+from typing import Any
+
+from grafana_dashboards import errors
+
+__author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
+
+_MAGIC = b'GDB-BUNDLE\n'
+_VERSION = 1
+
+
+def write_bundle(path: str | Path, definitions: dict[str, dict[str, Any]]) -> None:
+    """Writes component definitions by type and name, as returned by ComponentRegistry.get_definitions, to path.
+
+    Includes are already resolved and the data is frozen, so loading needs no further processing.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    try:
+        with open(temporary, 'wb') as fp:
+            fp.write(_MAGIC)
+            pickle.dump((_VERSION, definitions), fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+    finally:
+        temporary.unlink(missing_ok=True)
+
+
+def read_bundle(path: str | Path) -> dict[str, dict[str, Any]]:
+    """Reads component definitions written by write_bundle, bundles are trusted input just like definition files."""
+    with open(path, 'rb') as fp:
+        if fp.read(len(_MAGIC)) != _MAGIC:
+            raise errors.BundleFormatError(f"'{path}' is not a definition bundle")
+        (version, definitions) = pickle.load(fp)
+    if version != _VERSION:
+        raise errors.BundleFormatError(f"'{path}' is a bundle of version {version}, expected {_VERSION}, compile it again")
+    return definitions
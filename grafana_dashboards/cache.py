@@ -0,0 +1,113 @@
+# Copyright 2015-2025 grafana-dashboard-builder contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Any
+
+import yaml
+
+from grafana_dashboards.gdbyaml import IncludeResolver, load_all_with_includes
+
+__author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+_CACHE_SIZE = 256 * 1024 * 1024
+# to be increased whenever parsed documents are stored differently, e.g. when freezing or include proxies change
+_FORMAT_VERSION = 1
+
+
+def _hash_file(path: str | Path) -> str:
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+class ParseCache:
+    """Parsed YAML documents stored on disk, keyed by content of the file and of all files it includes.
+
+    Least recently used entries are removed when the cache grows over max_size bytes.
+    """
+
+    def __init__(self, cache_dir: str | Path, max_size: int = _CACHE_SIZE) -> None:
+        super().__init__()
+        self._cache_dir = Path(cache_dir)
+        self._max_size = max_size
+        self._size: int | None = None
+
+    def load_all(self, path: str, loader: type, includes: IncludeResolver | None = None) -> list[Any]:
+        content = Path(path).read_bytes()
+        lazy = b'lazy' if includes is not None and includes.lazy else b''
+        key = hashlib.sha256(b'\0'.join([str(_FORMAT_VERSION).encode(), str(Path(path).absolute()).encode(), loader.__name__.encode(), lazy,
+                                         yaml.__version__.encode(), content])).hexdigest()
+        entry = self._cache_dir / f'{key}.pickle'
+        documents = self._read(entry)
+        if documents is not None:
+            logger.debug("Using cached definitions of '%s'", path)
+            return documents
+        stream = io.BytesIO(content)
+        stream.name = path
+        (documents, included_files) = load_all_with_includes(stream, loader, includes)
+        self._write(entry, ([(str(included), _hash_file(included)) for included in dict.fromkeys(included_files)], documents))
+        return documents
+
+    def _read(self, entry: Path) -> list[Any] | None:
+        try:
+            with open(entry, 'rb') as fp:
+                (includes, documents) = pickle.load(fp)
+            if any(_hash_file(included) != digest for (included, digest) in includes):
+                return None
+            os.utime(entry)
+            return documents
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.debug("Ignoring unreadable cache entry '%s': %s", entry, e)
+            return None
+
+    def _write(self, entry: Path, value: Any) -> None:
+        temporary = None
+        try:
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self._cache_dir, suffix='.tmp', delete=False) as fp:
+                temporary = Path(fp.name)
+                pickle.dump(value, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, entry)
+        except Exception as e:
+            logger.warning("Cannot write cache entry '%s': %s", entry, e)
+            # temporary files are not counted to the cache size, they would never be evicted
+            if temporary is not None:
+                temporary.unlink(missing_ok=True)
+            return
+        if self._size is None:
+            self._size = sum(cached.stat().st_size for cached in self._cache_dir.glob('*.pickle'))
+        else:
+            self._size += entry.stat().st_size
+        if self._size > self._max_size:
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = sorted(((cached.stat(), cached) for cached in self._cache_dir.glob('*.pickle')),
+                         key=lambda item: item[0].st_mtime)
+        self._size = sum(stat.st_size for (stat, _) in entries)
+        for (stat, cached) in entries:
+            if self._size <= self._max_size:
+                break
+            cached.unlink(missing_ok=True)
+            self._size -= stat.st_size
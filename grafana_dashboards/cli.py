@@ -13,19 +13,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import argparse
+import fnmatch
 import logging
 import os
-from collections.abc import Iterable
+import sys
+from collections.abc import Iterable, Iterator
 from pathlib import Path
 
 import yaml
 
+from grafana_dashboards.cache import ParseCache
 from grafana_dashboards.client.elastic_search import ElasticSearchExporter
 from grafana_dashboards.client.grafana import GrafanaExporter
 from grafana_dashboards.common import get_component_type, load_source
 from grafana_dashboards.config import Config
 from grafana_dashboards.exporter import DashboardExporter, FileExporter, ProjectProcessor
-from grafana_dashboards.gdbyaml import GDBLoader
+from grafana_dashboards.gdbyaml import FastGDBLoader
 from grafana_dashboards.parser import DefinitionParser
 
 __author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
@@ -37,23 +40,95 @@ def _initialize_exporters(exporter_names: Iterable[str], exporter_types: list[ty
     return [exporter(**config.get_config(name)) for (name, exporter) in exporters.items()]
 
 
-def _process_paths(paths: list[str]) -> set[str]:
+_DEFINITION_PATTERNS = ['*.yaml', '*.yml']
+
+
+def _process_paths(paths: list[str], include: Iterable[str] = _DEFINITION_PATTERNS, exclude: Iterable[str] = ()) -> list[str]:
+    """Returns sorted definition files, directories are searched for files matching include and not exclude.
+
+    Patterns are matched against both the name and the path relative to the searched directory, hidden files and
+    directories are skipped. Files given explicitly are always used.
+    """
     definition_files: set[str] = set()
     for path in paths:
         if Path(path).is_dir():
-            for root, _, filenames in os.walk(path):
-                s = {str(Path(root) / filename) for filename in filenames}
-                definition_files = definition_files.union(s)
+            definition_files.update(_scan_dir(path, '', list(include), list(exclude)))
         else:
             definition_files.add(path)
-    return definition_files
+    return sorted(definition_files)
+
+
+def _scan_dir(root: str, relative: str, include: list[str], exclude: list[str]) -> Iterator[str]:
+    with os.scandir(os.path.join(root, relative)) as entries:
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            entry_path = f'{relative}/{entry.name}' if relative else entry.name
+            if _matches(entry.name, entry_path, exclude):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                yield from _scan_dir(root, entry_path, include, exclude)
+            elif entry.is_file() and _matches(entry.name, entry_path, include):
+                yield entry.path
+
+
+def _matches(name: str, path: str, patterns: list[str]) -> bool:
+    return any(fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(path, pattern) for pattern in patterns)
+
+
+def _add_parse_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--include', nargs='+', type=str, default=_DEFINITION_PATTERNS,
+                        help='Glob patterns of definition files searched for in directories given by path, *.yaml and *.yml by default')
+    parser.add_argument('--exclude', nargs='+', type=str, default=[],
+                        help='Glob patterns of files and directories skipped when searching directories given by path')
+    parser.add_argument('--plugins', nargs='+', type=str,
+                        help='List of external component plugins to load')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not use cache of parsed definition files stored in .grafana/cache')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of processes used to parse definition files and to render dashboards')
+    parser.add_argument('--lazy-includes', action='store_true',
+                        help='Read included files only when components using them are rendered')
+
+
+def _create_definition_parser(args: argparse.Namespace) -> DefinitionParser:
+    if args.plugins:
+        for plugin in args.plugins:
+            try:
+                load_source('grafana_dashboards.components.$loaded', plugin)
+            except Exception as e:
+                print(f'Cannot load plugin {plugin}: {str(e)}')
+    parse_cache = None if args.no_cache else ParseCache(Path('.grafana') / 'cache')
+    return DefinitionParser(parse_cache, args.jobs, args.lazy_includes)
+
+
+def compile_bundle(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog='grafana-dashboard-builder compile',
+                                     description='Parses definition files once into a bundle that can be used by --bundle instead of path.')
+    parser.add_argument('-p', '--path', required=True, nargs='+', type=str,
+                        help='List of path to YAML definition files')
+    parser.add_argument('-o', '--output', required=True,
+                        help='Path to the bundle file')
+    _add_parse_arguments(parser)
+
+    args = parser.parse_args(argv)
+
+    definition_parser = _create_definition_parser(args)
+    definition_parser.compile_bundle(_process_paths(args.path, args.include, args.exclude), args.output)
+    logging.info("Definitions compiled to '%s'", args.output)
 
 
 def main() -> None:
     logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', level=logging.INFO)
+    if sys.argv[1:2] == ['compile']:
+        compile_bundle(sys.argv[2:])
+        return
     parser = argparse.ArgumentParser()
-    parser.add_argument('-p', '--path', required=True, nargs='+', type=str,
-                        help='List of path to YAML definition files')
+    definitions = parser.add_mutually_exclusive_group(required=True)
+    definitions.add_argument('-p', '--path', nargs='+', type=str,
+                             help='List of path to YAML definition files')
+    definitions.add_argument('--bundle',
+                             help='Definition bundle written by the compile command, used instead of path')
     parser.add_argument('--project',
                         help='(deprecated, use path) Location of the file containing project definition.')
     parser.add_argument('-o', '--out',
@@ -63,26 +138,23 @@ def main() -> None:
     parser.add_argument('--context', default='{}',
                         help='YAML structure defining parameters for dashboard definition.'
                              ' Effectively overrides any parameter defined on project level.')
-    parser.add_argument('--plugins', nargs='+', type=str,
-                        help='List of external component plugins to load')
     parser.add_argument('--exporter', nargs='+', type=str, default=set(), dest='exporters',
                         help='List of dashboard exporters')
     parser.add_argument('--message', required=False, type=str,
                         help='Set a commit message for the Grafana version history')
+    parser.add_argument('--project-name', nargs='+', type=str, dest='project_names',
+                        help='Names of projects to process, all projects are processed by default')
+    parser.add_argument('--max-contexts', required=False, type=int,
+                        help='Fail before generating anything when a project expands to more contexts than this')
+    _add_parse_arguments(parser)
 
     args = parser.parse_args()
 
-    if args.plugins:
-        for plugin in args.plugins:
-            try:
-                load_source('grafana_dashboards.components.$loaded', plugin)
-            except Exception as e:
-                print(f'Cannot load plugin {plugin}: {str(e)}')
+    definition_parser = _create_definition_parser(args)
 
     if args.project:
         logging.warn("Using deprecated option '--project'")
         args.path.add(args.project)
-    paths = _process_paths(args.path)
 
     config = Config(args.config)
     exporters = set(args.exporters)
@@ -97,10 +169,13 @@ def main() -> None:
                                                 config)
 
     context = config.get_config('context')
-    context.update(yaml.load(args.context, Loader=GDBLoader))
+    context.update(yaml.load(args.context, Loader=FastGDBLoader))
 
-    projects = DefinitionParser().load_projects(paths)
-    project_processor = ProjectProcessor(dashboard_exporters)
+    if args.bundle:
+        projects = definition_parser.load_bundle(args.bundle, args.project_names)
+    else:
+        projects = definition_parser.load_projects(_process_paths(args.path, args.include, args.exclude), args.project_names)
+    project_processor = ProjectProcessor(dashboard_exporters, args.max_contexts, args.jobs)
     project_processor.process_projects(projects, context)
 
 
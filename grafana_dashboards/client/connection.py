@@ -15,12 +15,19 @@ from __future__ import annotations
 
 import abc
 import base64
+import http.client
+import io
 import json
 import logging
+import threading
+import time
+from http.client import HTTPConnection
 from http.cookiejar import CookieJar
 from typing import Any
+from urllib.error import URLError
 from urllib.parse import urlparse
 from urllib.request import BaseHandler, HTTPCookieProcessor, HTTPDefaultErrorHandler, HTTPHandler, HTTPSHandler, Request, build_opener
+from urllib.response import addinfourl
 
 import requests
 from requests_kerberos import HTTPKerberosAuth
@@ -29,6 +36,9 @@ __author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
 
 logger = logging.getLogger(__name__)
 
+_POOL_SIZE = 10
+_POOL_IDLE_TIMEOUT = 30.0
+
 
 class ConnectionInterface(metaclass=abc.ABCMeta):
     @classmethod
@@ -48,12 +58,14 @@ class BaseConnection(ConnectionInterface):
         'Accept': 'application/json'
     }
 
-    def __init__(self, host: str, auth_header: str, debug: int = 0) -> None:
+    def __init__(self, host: str, auth_header: str, debug: int = 0, pool_size: int = _POOL_SIZE,
+                 idle_timeout: float = _POOL_IDLE_TIMEOUT) -> None:
         self._host = host
         self._headers['Authorization'] = auth_header
 
-        self._opener = build_opener(HTTPHandler(debuglevel=debug),
-                                    HTTPSHandler(debuglevel=debug),
+        pool = ConnectionPool(pool_size, idle_timeout)
+        self._opener = build_opener(KeepAliveHTTPHandler(pool, debuglevel=debug),
+                                    KeepAliveHTTPSHandler(pool, debuglevel=debug),
                                     HTTPCookieProcessor(CookieJar()),
                                     LoggingHandler(),
                                     HTTPDefaultErrorHandler())
@@ -67,19 +79,117 @@ class BaseConnection(ConnectionInterface):
 
 
 class BasicAuthConnection(BaseConnection):
-    def __init__(self, username: str, password: str, host: str, debug: int = 0) -> None:
+    def __init__(self, username: str, password: str, host: str, debug: int = 0, pool_size: int = _POOL_SIZE,
+                 idle_timeout: float = _POOL_IDLE_TIMEOUT) -> None:
         logger.debug('Creating new connection with username=%s host=%s', username, host)
 
         base64string = base64.encodebytes(f'{username}:{password}'.encode()).replace(b'\n', b'').decode('utf-8')
 
-        super().__init__(host, f'Basic {base64string}', debug)
+        super().__init__(host, f'Basic {base64string}', debug, pool_size, idle_timeout)
 
 
 class BearerAuthConnection(BaseConnection):
-    def __init__(self, token: str, host: str, debug: int = 0) -> None:
+    def __init__(self, token: str, host: str, debug: int = 0, pool_size: int = _POOL_SIZE,
+                 idle_timeout: float = _POOL_IDLE_TIMEOUT) -> None:
         logger.debug('Creating new connection with token=%s host=%s', token[:5], host)
 
-        super().__init__(host, f'Bearer {token.strip()}', debug)
+        super().__init__(host, f'Bearer {token.strip()}', debug, pool_size, idle_timeout)
+
+
+class ConnectionPool:
+    """Idle HTTP/1.1 connections kept open for reuse, at most size per host and each for at most idle_timeout seconds."""
+
+    def __init__(self, size: int = _POOL_SIZE, idle_timeout: float = _POOL_IDLE_TIMEOUT) -> None:
+        super().__init__()
+        self._size = size
+        self._idle_timeout = idle_timeout
+        self._idle: dict[tuple[str, str], list[tuple[float, HTTPConnection]]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: tuple[str, str]) -> HTTPConnection | None:
+        """Returns the most recently used idle connection to host, None if there is none."""
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                (released, connection) = idle.pop()
+                if now - released < self._idle_timeout:
+                    return connection
+                connection.close()
+                # older connections left in the list are expired as well
+                for (_, expired) in idle:
+                    expired.close()
+                idle.clear()
+        return None
+
+    def release(self, key: tuple[str, str], connection: HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self._size:
+                idle.append((time.monotonic(), connection))
+                return
+        connection.close()
+
+
+class _KeepAliveHandlerMixin:
+    """Sends requests over pooled keep-alive connections, responses are read whole before the connection is reused."""
+
+    _pool: ConnectionPool
+    _debuglevel: int
+
+    def do_open(self, http_class: Any, req: Request, **http_conn_args: Any) -> Any:
+        if req._tunnel_host:  # type: ignore[attr-defined]
+            return super().do_open(http_class, req, **http_conn_args)  # type: ignore[misc]
+        if not req.host:
+            raise URLError('no host given')
+        key = (req.type, req.host)
+        headers = dict(req.unredirected_hdrs)
+        headers.update({k: v for k, v in req.headers.items() if k not in headers})
+        headers = {name.title(): value for (name, value) in headers.items()}
+
+        try:
+            connection = self._pool.acquire(key)
+            if connection is not None:
+                try:
+                    return self._send(key, connection, req, headers)
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    # server closed the idle connection in the meantime, the request is sent again over a new one
+                    logger.debug('Reconnecting stale connection to %s', req.host)
+            connection = http_class(req.host, timeout=req.timeout, **http_conn_args)
+            connection.set_debuglevel(self._debuglevel)
+            return self._send(key, connection, req, headers)
+        except OSError as e:
+            raise URLError(e) from e
+
+    def _send(self, key: tuple[str, str], connection: HTTPConnection, req: Request, headers: dict[str, str]) -> addinfourl:
+        try:
+            connection.timeout = req.timeout
+            connection.request(req.get_method(), req.selector, req.data, headers,
+                               encode_chunked=req.has_header('Transfer-encoding'))
+            response = connection.getresponse()
+            body = response.read()
+        except BaseException:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            self._pool.release(key, connection)
+        result = addinfourl(io.BytesIO(body), response.msg, req.get_full_url(), response.status)
+        result.msg = response.reason  # type: ignore[attr-defined]
+        return result
+
+
+class KeepAliveHTTPHandler(_KeepAliveHandlerMixin, HTTPHandler):
+    def __init__(self, pool: ConnectionPool, debuglevel: int = 0) -> None:
+        super().__init__(debuglevel=debuglevel)
+        self._pool = pool
+
+
+class KeepAliveHTTPSHandler(_KeepAliveHandlerMixin, HTTPSHandler):
+    def __init__(self, pool: ConnectionPool, debuglevel: int = 0) -> None:
+        super().__init__(debuglevel=debuglevel)
+        self._pool = pool
 
 
 class LoggingHandler(BaseHandler):
@@ -102,21 +212,46 @@ class LoggingHandler(BaseHandler):
 
 
 class KerberosConnection(ConnectionInterface):
-    def __init__(self, host: str) -> None:
+    def __init__(self, host: str, pool_size: int = _POOL_SIZE) -> None:
         logger.debug('Creating new kerberos connection with host=%s', host)
         self._host = host
+        # negotiated Kerberos context and open connections are reused by all requests
+        self._session = _create_session(pool_size)
+        self._session.auth = HTTPKerberosAuth()
+        self._session.verify = False
 
     def make_request(self, uri: str, body: dict[str, Any] | None = None) -> dict[str, Any]:
-        response = requests.post(f'{self._host}{uri}', json=body, auth=HTTPKerberosAuth(), verify=False)
+        if body is None:
+            response = self._session.get(f'{self._host}{uri}')
+        else:
+            response = self._session.post(f'{self._host}{uri}', json=body)
+        # error responses are raised just like by urllib in BaseConnection
+        response.raise_for_status()
         return response.json()
 
 
 class SSLAuthConnection(ConnectionInterface):
-    def __init__(self, host: str, cert_bundle: str | tuple[str, str] | None, debug: int = 0):
+    def __init__(self, host: str, cert_bundle: str | tuple[str, str] | None, debug: int = 0, pool_size: int = _POOL_SIZE):
         logger.debug('Using SSL client cert from "%s" with host=%s', cert_bundle, host)
         self._host = host
         self._cert = cert_bundle
+        # client certificate is loaded and mutual TLS handshake done once per pooled connection
+        self._session = _create_session(pool_size)
+        self._session.cert = cert_bundle
 
     def make_request(self, uri: str, body: dict[str, Any] | None = None) -> dict[str, Any]:
-        response = requests.post(f'{self._host}{uri}', json=body, cert=self._cert)
+        if body is None:
+            response = self._session.get(f'{self._host}{uri}')
+        else:
+            response = self._session.post(f'{self._host}{uri}', json=body)
+        # error responses are raised just like by urllib in BaseConnection
+        response.raise_for_status()
         return response.json()
+
+
+def _create_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
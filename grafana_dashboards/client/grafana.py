@@ -13,10 +13,15 @@
 # limitations under the License.
 from __future__ import annotations
 
+import hashlib
+import itertools
+import json
 import logging
 import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import TypedDict, cast
+from typing import Any, TypedDict, cast
 try:
     # Try the standard library import (Python 3.11+)
     from typing import Unpack
@@ -24,6 +29,7 @@ except ImportError:
     # Fallback for older versions (Python < 3.11)
     from typing_extensions import Unpack
 
+from grafana_dashboards import errors
 from grafana_dashboards.client.connection import BasicAuthConnection, BearerAuthConnection, ConnectionInterface, KerberosConnection, SSLAuthConnection
 from grafana_dashboards.exporter import DashboardExporter
 
@@ -32,6 +38,9 @@ __author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
 
 logger = logging.getLogger(__name__)
 
+_MANIFEST_PATH = Path('.grafana') / 'grafana_manifest.json'
+_SEARCH_PAGE_SIZE = 5000
+
 
 class GrafanaExporterParams(TypedDict, total=False):
     host: str
@@ -42,6 +51,11 @@ class GrafanaExporterParams(TypedDict, total=False):
     ssl_client_crt: str
     ssl_client_key: str
     commit_message: str
+    concurrency: int
+    pool_size: int
+    pool_idle_timeout: float
+    skip_unchanged: bool
+    manifest: str
 
 
 class GrafanaExporter(DashboardExporter):
@@ -50,17 +64,30 @@ class GrafanaExporter(DashboardExporter):
     def __init__(self, **kwargs: Unpack[GrafanaExporterParams]):
         super().__init__()
         self._commit_message = kwargs.get('commit_message', "")
+        self._concurrency = int(os.getenv('GRAFANA_CONCURRENCY', kwargs.get('concurrency', 1)))
+        self._executor: ThreadPoolExecutor | None = None
+        self._in_flight = threading.BoundedSemaphore(self._concurrency)
+        self._uploads: list[tuple[str, Future[None]]] = []
+        self._uploaded = self._skipped = self._failed = 0
+        self._lock = threading.Lock()
         self._host = cast(str, os.getenv('GRAFANA_HOST', kwargs.get('host')))
         password = cast(str, os.getenv('GRAFANA_PASSWORD', kwargs.get('password')))
         username = cast(str, os.getenv('GRAFANA_USERNAME', kwargs.get('username')))
         auth_token = cast(str, os.getenv('GRAFANA_TOKEN', kwargs.get('token')))
         use_kerberos = os.getenv('GRAFANA_USE_KERBEROS', kwargs.get('use_kerberos'))
         client_crt = cast(str, os.getenv('GRAFANA_SSL_CLIENT_CRT', kwargs.get('ssl_client_crt')))
+        # idle connections kept for reuse, enough for all concurrent uploads by default
+        pool_size = kwargs.get('pool_size', max(self._concurrency, 10))
+        pool_idle_timeout = kwargs.get('pool_idle_timeout', 30.0)
+
+        self._manifest = None
+        if os.getenv('GRAFANA_SKIP_UNCHANGED', kwargs.get('skip_unchanged')):
+            self._manifest = UploadManifest(kwargs.get('manifest', _MANIFEST_PATH), self._host)
 
         if use_kerberos:
-            self._connection = KerberosConnection(self._host)
+            self._connection = KerberosConnection(self._host, pool_size=pool_size)
         elif auth_token:
-            self._connection = BearerAuthConnection(auth_token, self._host)
+            self._connection = BearerAuthConnection(auth_token, self._host, pool_size=pool_size, idle_timeout=pool_idle_timeout)
         elif client_crt:
             client_key = cast(str, os.getenv('GRAFANA_SSL_CLIENT_KEY', kwargs.get('ssl_client_key')))
             derived_key_path = Path(f'{Path(client_crt).stem}.key')
@@ -71,9 +98,9 @@ class GrafanaExporter(DashboardExporter):
             # otherwise assume bundled PEM
             else:
                 cert_bundle = client_crt
-            self._connection = SSLAuthConnection(self._host, cert_bundle)
+            self._connection = SSLAuthConnection(self._host, cert_bundle, pool_size=pool_size)
         else:
-            self._connection = BasicAuthConnection(username, password, self._host)
+            self._connection = BasicAuthConnection(username, password, self._host, pool_size=pool_size, idle_timeout=pool_idle_timeout)
 
     def process_dashboard(self, project_name: str, dashboard_name: str, dashboard_data: dict[str, str]) -> None:
         super().process_dashboard(project_name, dashboard_name, dashboard_data)
@@ -86,5 +113,132 @@ class GrafanaExporter(DashboardExporter):
         if 'uid' in dashboard_data:
             body.update({'uid': dashboard_data['uid']})
 
+        digest = None
+        if self._manifest is not None:
+            if not self._manifest.is_fetched():
+                self._manifest.fetch_remote(self._connection)
+            digest = UploadManifest.get_hash(dashboard_data)
+            if self._manifest.is_unchanged(dashboard_data, digest):
+                logger.info("Skipping unchanged dashboard '%s'", dashboard_name)
+                self._skipped += 1
+                return
+
+        if self._concurrency <= 1:
+            self._upload(dashboard_name, body, digest)
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._concurrency, thread_name_prefix='grafana-upload')
+        # blocks until one of the uploads in flight finishes
+        self._in_flight.acquire()
+        try:
+            self._uploads.append((dashboard_name, self._executor.submit(self._upload_concurrently, dashboard_name, body, digest)))
+        except BaseException:
+            self._in_flight.release()
+            raise
+
+    def _upload_concurrently(self, dashboard_name: str, body: dict[str, Any], digest: str | None) -> None:
+        try:
+            self._upload(dashboard_name, body, digest)
+        except Exception as e:
+            logger.error("Failed to upload dashboard '%s' to %s: %s", dashboard_name, self._host, e)
+            raise
+        finally:
+            self._in_flight.release()
+
+    def _upload(self, dashboard_name: str, body: dict[str, Any], digest: str | None) -> None:
         logger.info("Uploading dashboard '%s' to %s", dashboard_name, self._host)
-        self._connection.make_request('/api/dashboards/db', body)
+        try:
+            response = self._connection.make_request('/api/dashboards/db', body)
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        with self._lock:
+            self._uploaded += 1
+        if self._manifest is not None and digest is not None and response.get('status') == 'success':
+            self._manifest.record(body['dashboard'], digest, response)
+
+    def close(self, completed: bool = True) -> None:
+        """Waits for all concurrent uploads, raises ExportError naming dashboards that were not uploaded."""
+        failed = []
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+            failed = [dashboard_name for (dashboard_name, upload) in self._uploads if upload.exception() is not None]
+            self._uploads = []
+        if self._manifest is not None:
+            self._manifest.save()
+        logger.info('Uploaded %s dashboards to %s, %s unchanged skipped, %s failed', self._uploaded, self._host, self._skipped, self._failed)
+        if failed:
+            raise errors.ExportError(f"Failed to upload dashboards to {self._host}: {', '.join(failed)}")
+
+
+class UploadManifest:
+    """Hashes of dashboards last uploaded to a host, with uid and version Grafana assigned to them.
+
+    Dashboard is unchanged when its hash matches and its uid is still found by the search API on the host.
+    """
+
+    def __init__(self, path: str | Path, host: str) -> None:
+        super().__init__()
+        self._path = Path(path)
+        self._host = host
+        self._manifests: dict[str, dict[str, dict[str, Any]]] = {}
+        try:
+            self._manifests = json.loads(self._path.read_text())
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable upload manifest '%s': %s", self._path, e)
+        self._entries = self._manifests.get(host, {})
+        self._remote_uids: set[str] | None = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(dashboard_data: dict[str, Any]) -> str:
+        if 'uid' in dashboard_data:
+            return f"uid:{dashboard_data['uid']}"
+        return f"title:{dashboard_data.get('folderId', 0)}/{dashboard_data.get('title')}"
+
+    @staticmethod
+    def get_hash(dashboard_data: dict[str, Any]) -> str:
+        return hashlib.sha256(json.dumps(dashboard_data, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+    def is_fetched(self) -> bool:
+        return self._remote_uids is not None
+
+    def fetch_remote(self, connection: ConnectionInterface) -> None:
+        """Gets uids of all dashboards on the host page by page, every dashboard is uploaded when that fails."""
+        remote_uids: set[str] = set()
+        try:
+            for page in itertools.count(1):
+                hits = cast(list[dict[str, Any]], connection.make_request(f'/api/search?type=dash-db&limit={_SEARCH_PAGE_SIZE}&page={page}'))
+                remote_uids.update(hit['uid'] for hit in hits)
+                if len(hits) < _SEARCH_PAGE_SIZE:
+                    break
+        except Exception as e:
+            logger.warning('Cannot fetch dashboards from %s, uploading all of them: %s', self._host, e)
+            remote_uids = set()
+        logger.info('Found %s dashboards on %s', len(remote_uids), self._host)
+        self._remote_uids = remote_uids
+
+    def is_unchanged(self, dashboard_data: dict[str, Any], digest: str) -> bool:
+        entry = self._entries.get(self.get_key(dashboard_data))
+        return entry is not None and entry['hash'] == digest and self._remote_uids is not None and entry.get('uid') in self._remote_uids
+
+    def record(self, dashboard_data: dict[str, Any], digest: str, response: dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[self.get_key(dashboard_data)] = {'hash': digest, 'uid': response.get('uid', dashboard_data.get('uid')),
+                                                           'version': response.get('version')}
+
+    def save(self) -> None:
+        with self._lock:
+            self._manifests[self._host] = self._entries
+            content = json.dumps(self._manifests, sort_keys=True, indent=2)
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            temporary = self._path.with_name(f'.{self._path.name}.{os.getpid()}.tmp')
+            temporary.write_text(content)
+            os.replace(temporary, self._path)
+        except OSError as e:
+            logger.warning("Cannot write upload manifest '%s': %s", self._path, e)
@@ -28,7 +28,7 @@ class Yaxes(JsonListGenerator):
 
     def gen_json_from_data(self, data: list[Any], context: Context) -> list[Any]:
         if len(data) == 1:
-            data.append(data[0])
+            data = [data[0], data[0]]
         return super().gen_json_from_data(data, context)
 
     def gen_item_json(self, items: str | dict[str, Any], result_list: list[Any]) -> None:
@@ -14,15 +14,18 @@
 from __future__ import annotations
 
 import logging
+import re
 import string
 import uuid
 from abc import ABCMeta, abstractmethod
-from collections.abc import Iterable
+from collections import OrderedDict
+from collections.abc import Callable, Generator, Iterable, Mapping
+from types import MappingProxyType
 from typing import Any, TypeVar
 
 from grafana_dashboards import errors
 from grafana_dashboards.common import get_component_type
-from grafana_dashboards.context import Context
+from grafana_dashboards.context import Context, StaticDict, StaticList, freeze
 
 T = TypeVar('T', bound='ComponentBase')
 
@@ -30,37 +33,128 @@ __author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
 
 logger = logging.getLogger(__name__)
 
+_RENDER_CACHE_SIZE = 4096
+
+# components created for every render register the same copy fields, their copy plans are built once per class
+_copy_plans: dict[type, tuple[set[str | tuple[str, Any | None]], list[tuple[str, bool, Any]]]] = {}
+
 
 def get_generators() -> list[type]:
     return _get_subclasses(JsonGenerator)
 
 
 def _get_subclasses(clazz: type) -> list[type]:
-    direct_subclasses = clazz.__subclasses__()
+    direct_subclasses: list[type] = clazz.__subclasses__()
     return [sub for sub in
             direct_subclasses + [sub_class for direct in direct_subclasses for sub_class in _get_subclasses(direct)]
             if sub not in (ComponentBase, JsonGenerator, JsonListGenerator)]
 
 
+def _find_references(data: Any, index: ComponentIndex) -> Generator[tuple[type, str], Any, None]:
+    # named components are referenced from items of list components stored under their type name
+    if isinstance(data, dict):
+        for (key, value) in data.items():
+            list_type = index.types.get(key) if isinstance(key, str) else None
+            if list_type is None or not issubclass(list_type, JsonListGenerator):
+                pass
+            elif isinstance(value, str):
+                # placeholder expanding to a list may reference any component of the type
+                yield list_type, value
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, str):
+                        yield list_type, item
+                    elif isinstance(item, dict):
+                        yield from ((list_type, item_type) for item_type in item)
+            yield from _find_references(value, index)
+    elif isinstance(data, list):
+        for item in data:
+            yield from _find_references(item, index)
+
+
 def get_placeholders(component_name: str) -> list[str]:
     return [v[1] for v in string.Formatter().parse(component_name) if v[1]]
 
 
+class RenderCache:
+    """Renders of components keyed on values of the context keys each render read, least recently used are evicted."""
+
+    def __init__(self, max_size: int = _RENDER_CACHE_SIZE) -> None:
+        super().__init__()
+        self._max_size = max_size
+        self._renders: OrderedDict[tuple[Any, ...], Any] = OrderedDict()
+        self._read_keys: dict[JsonGenerator, list[tuple[str, ...]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, component: JsonGenerator, context: Context, render: Callable[[Context], Any]) -> Any:
+        read_keys = self._read_keys.setdefault(component, [])
+        try:
+            for keys in read_keys:
+                cache_key = (component, keys, context.get_values(keys))
+                if cache_key in self._renders:
+                    self.hits += 1
+                    self._renders.move_to_end(cache_key)
+                    return self._renders[cache_key]
+        except TypeError:
+            # context values that cannot be hashed are never cached
+            return render(context)
+        self.misses += 1
+        read: set[str] = set()
+        result = render(context.record_reads(read))
+        keys = tuple(sorted(read))
+        try:
+            cache_key = (component, keys, context.get_values(keys))
+        except TypeError:
+            return result
+        if keys not in read_keys:
+            read_keys.append(keys)
+        self._renders[cache_key] = result
+        if len(self._renders) > self._max_size:
+            self._renders.popitem(last=False)
+        return result
+
+
+class ComponentIndex:
+    """Component types and their item types, frozen when built so that plugins must be loaded before."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        classes = _get_subclasses(ComponentBase)
+        self.types: Mapping[str, type] = MappingProxyType({get_component_type(clazz): clazz for clazz in classes})
+        self.type_names: Mapping[type, str] = MappingProxyType({clazz: get_component_type(clazz) for clazz in classes})
+        self._item_types: Mapping[type, frozenset[str]] = MappingProxyType({
+            clazz: frozenset(self.type_names[sub_class] for sub_class in _get_subclasses(clazz)) for clazz in classes
+        })
+
+    def get_type_name(self, clazz: type) -> str:
+        type_name = self.type_names.get(clazz)
+        return type_name if type_name is not None else get_component_type(clazz)
+
+    def get_item_types(self, item_base_classes: list[type]) -> frozenset[str]:
+        if len(item_base_classes) == 1 and item_base_classes[0] in self._item_types:
+            return self._item_types[item_base_classes[0]]
+        return frozenset(self.get_type_name(clazz) for item_base_class in item_base_classes for clazz in _get_subclasses(item_base_class))
+
+
 class ComponentRegistry:
     _components: dict[type, dict[str, ComponentBase]]
 
     def __init__(self) -> None:
         super().__init__()
-        self._types: dict[str, type] = {}
+        self.index = ComponentIndex()
+        self._definitions: dict[type, dict[str, dict[str, Any]]] = {}
         self._components: dict[type, dict[str, ComponentBase]] = {}
-        for clazz in _get_subclasses(ComponentBase):
+        self.render_cache = RenderCache()
+        self._static_components: dict[tuple[type, int], tuple[Any, ComponentBase]] = {}
+        for clazz in self.index.type_names:
             logger.info('Loading component type %s', clazz)
-            self._types[get_component_type(clazz)] = clazz
+            self._definitions[clazz] = {}
             self._components[clazz] = {}
 
     def _class_for_type(self, component_type: str | type[T] | None) -> type[T]:
         if isinstance(component_type, str):
-            component_type = self._types.get(component_type)
+            component_type = self.index.types.get(component_type)
         if component_type is None:
             raise errors.UnregisteredComponentError(f"No component of type '{component_type}' found!")
         if self._components.get(component_type) is None:
@@ -88,14 +182,73 @@ class ComponentRegistry:
             logger.info("Missing implementation class for component '%s', skipping", component_type)
             return
         logger.debug("Adding component '%s' with name '%s'", component_type, component_name)
-        components = self._get_component(clazz)
-        if component_name in components:
+        # components are created only when first used
+        definitions = self._get_definitions(clazz)
+        if component_name in definitions:
             raise errors.DuplicateKeyError(
                 f"Key '{component_name}' is already defined for component {component_type}")
-        components[component_name] = self.create_component(clazz, component)
+        definitions[component_name] = component
+
+    def add_definitions(self, component_type: str, definitions: Mapping[str, dict[str, Any]]) -> None:
+        """Adds components by name of a single type at once, as returned by get_definitions."""
+        try:
+            clazz: type[ComponentBase] = self._class_for_type(component_type)
+        except errors.UnregisteredComponentError:
+            logger.info("Missing implementation class for component '%s', skipping", component_type)
+            return
+        existing = self._get_definitions(clazz)
+        for component_name in definitions:
+            if component_name in existing:
+                raise errors.DuplicateKeyError(
+                    f"Key '{component_name}' is already defined for component {component_type}")
+        existing.update(definitions)
+
+    def get_definitions(self) -> dict[str, dict[str, dict[str, Any]]]:
+        """Returns read-only definitions of all components by their type and name."""
+        return {self.index.get_type_name(clazz): {name: freeze(definition) for (name, definition) in definitions.items()}
+                for (clazz, definitions) in self._definitions.items()}
+
+    def retain_reachable(self, roots: Iterable[tuple[type, str]]) -> None:
+        """Drops definitions of components that cannot be used by the root components."""
+        reachable: set[tuple[type, str]] = set()
+        to_visit = list(roots)
+        while to_visit:
+            (clazz, reference) = to_visit.pop()
+            for name in self._find_definitions(clazz, reference):
+                if (clazz, name) not in reachable and issubclass(clazz, ComponentBase):
+                    reachable.add((clazz, name))
+                    # lazy includes of reachable definitions are loaded here, frozen definitions are used as they are later
+                    definition = self._definitions[clazz][name] = freeze(self._definitions[clazz][name])
+                    to_visit.extend(clazz.get_references(definition, self.index))
+        unreachable = 0
+        for (clazz, definitions) in self._definitions.items():
+            for name in [name for name in definitions if (clazz, name) not in reachable]:
+                del definitions[name]
+                unreachable += 1
+        logger.info('Skipping %s component definitions not used by selected projects', unreachable)
+
+    def _find_definitions(self, clazz: type, reference: str) -> list[str]:
+        definitions = self._definitions.get(clazz, {})
+        if reference in definitions:
+            return [reference]
+        if not isinstance(reference, str) or ('{' not in reference and '}' not in reference):
+            return []
+        # placeholders in references are expanded before the lookup, they may match any name
+        try:
+            pattern = re.compile(''.join(re.escape(literal) + ('.*' if field is not None else '')
+                                         for (literal, field, _, _) in string.Formatter().parse(reference)), re.DOTALL)
+        except ValueError:
+            return list(definitions)
+        return [name for name in definitions if isinstance(name, str) and pattern.fullmatch(name)]
 
     def __getitem__(self, item: type[T]) -> Iterable[T]:
-        return self._get_component(item).values()
+        return [self.get_component(item, name) for name in self._get_definitions(item)]
+
+    def _get_definitions(self, item: type) -> dict[str, dict[str, Any]]:
+        definitions = self._definitions.get(item)
+        if definitions is None:
+            raise errors.UnregisteredComponentError(f"No component of type '{item}' found!")
+        return definitions
 
     def _get_component(self, item: type[T]) -> dict[str, T]:
         component: dict[str, T] | None = self._components.get(item)  # type: ignore
@@ -104,12 +257,31 @@ class ComponentRegistry:
         return component
 
     def create_component(self, component_type: str | type[T] | None, data: dict[str, Any]) -> T:
-        return self._class_for_type(component_type)(data, self)
+        clazz: type[T] = self._class_for_type(component_type)
+        component_data = data.get(self.index.get_type_name(clazz))
+        if 'name' in data or not isinstance(component_data, (StaticList, StaticDict)):
+            return clazz(data, self)
+        # placeholder-free data is shared by all renders, components created from it are built and rendered only once
+        key = (clazz, id(component_data))
+        if key not in self._static_components:
+            component = clazz(data, self)
+            if isinstance(component, JsonGenerator):
+                component._render_cache = self.render_cache
+            self._static_components[key] = (component_data, component)
+        return self._static_components[key][1]  # type: ignore
 
     def get_component(self, component_type: type[T], name: str) -> T:
-        component = self._get_component(component_type).get(name)
+        components = self._get_component(component_type)
+        component = components.get(name)
         if component is None:
-            raise errors.UnregisteredComponentError(f"No component '{component_type}' with name '{name}' found!")
+            definition = self._definitions[component_type].get(name)
+            if definition is None:
+                raise errors.UnregisteredComponentError(f"No component '{component_type}' with name '{name}' found!")
+            component = self.create_component(component_type, freeze(definition))
+            if isinstance(component, JsonGenerator):
+                # registered components are rendered again for every context they are used in
+                component._render_cache = self.render_cache
+            components[name] = component
         return component
 
 
@@ -118,22 +290,45 @@ class ComponentBase:
 
     def __init__(self, data: dict[str, Any], registry: ComponentRegistry) -> None:
         super().__init__()
-        self.data = data[get_component_type(type(self))]
+        self.data = data[registry.index.get_type_name(type(self))]
         if self.data is None:
             self.data = {}
         self.name = data.get('name', str(uuid.uuid4()))
         self.registry = registry
 
+    @classmethod
+    def get_references(cls, definition: dict[str, Any], index: ComponentIndex) -> Iterable[tuple[type, str]]:
+        """Returns types and names (possibly with placeholders) of named components the definition may use."""
+        return _find_references(definition, index)
+
 
 class JsonGenerator(ComponentBase, metaclass=ABCMeta):
     _copy_fields: set[str | tuple[str, Any | None]] = set()
+    _copy_plan: list[tuple[str, bool, Any]] = []
+    _copy_plan_fields: set[str | tuple[str, Any | None]] | None = None
+    _render_cache: RenderCache | None = None
 
     def _register_copy_fields(self, copy_fields: set[str | tuple[str, Any | None]]) -> None:
         self._copy_fields = self._copy_fields.union(copy_fields)
 
+    def _get_copy_plan(self) -> list[tuple[str, bool, Any]]:
+        """Returns copy fields as (field, has default, default) tuples, shared by instances of a class with the same copy fields."""
+        if self._copy_plan_fields is not self._copy_fields:
+            cached = _copy_plans.get(type(self))
+            if cached is None or cached[0] != self._copy_fields:
+                plan = [(field[0], True, field[1]) if isinstance(field, tuple) else (field, False, None) for field in self._copy_fields]
+                cached = _copy_plans[type(self)] = (self._copy_fields, plan)
+            (self._copy_plan_fields, self._copy_plan) = (self._copy_fields, cached[1])
+        return self._copy_plan
+
     def gen_json(self, context: Context | None = None) -> Any:
         if context is None:
             context = Context()
+        if self._render_cache is not None:
+            return self._render_cache.render(self, context, self._gen_json)
+        return self._gen_json(context)
+
+    def _gen_json(self, context: Context) -> Any:
         return self.gen_json_from_data(context.expand_placeholders(self.data), context)
 
     @abstractmethod
@@ -143,18 +338,17 @@ class JsonGenerator(ComponentBase, metaclass=ABCMeta):
 
 class ObjectJsonGenerator(JsonGenerator):
     def gen_json_from_data(self, data: dict[str, Any], context: Context) -> Any:
-        component_type = get_component_type(type(self))
-        if self.name:
-            logger.debug("Processing component '%s' with name '%s' from template '%s'",
-                         component_type, context.expand_placeholders(self.name), self.name)
-        else:
-            logger.debug("Processing anonymous component '%s'", component_type)
+        if logger.isEnabledFor(logging.DEBUG):
+            component_type = self.registry.index.get_type_name(type(self))
+            if self.name:
+                logger.debug("Processing component '%s' with name '%s' from template '%s'",
+                             component_type, context.expand_placeholders(self.name), self.name)
+            else:
+                logger.debug("Processing anonymous component '%s'", component_type)
         json = {}
-        for field in self._copy_fields:
-            if isinstance(field, tuple):
-                field_key = field[0]
-                field_default = field[1]
-                json[field_key] = data.get(field_key, field_default)
+        for (field, has_default, default) in self._get_copy_plan():
+            if has_default:
+                json[field] = data.get(field, default)
             elif field in data:
                 json[field] = data[field]
         return json
@@ -163,11 +357,7 @@ class ObjectJsonGenerator(JsonGenerator):
 class JsonListGenerator(JsonGenerator):
     def __init__(self, data: Any, registry: ComponentRegistry, item_base_classes: list[type]) -> None:
         super().__init__(data, registry)
-        self.component_item_types = [
-            get_component_type(clazz)
-            for item_base_class in item_base_classes
-            for clazz in _get_subclasses(item_base_class)
-        ]
+        self.component_item_types = registry.index.get_item_types(item_base_classes)
 
     def gen_json_from_data(self, data: Any, context: Context) -> list[Any]:
         result_list: list[Any] = []
@@ -13,7 +13,6 @@
 # limitations under the License.
 from typing import Any
 
-from grafana_dashboards.common import get_component_type
 from grafana_dashboards.components.annotations import Annotations
 from grafana_dashboards.components.base import ComponentRegistry, ObjectJsonGenerator
 from grafana_dashboards.components.rows import Rows
@@ -58,11 +57,11 @@ class Dashboard(ObjectJsonGenerator):
             json_data['folderId'] = data.get('folderId')
         if 'uid' in data:
             json_data['uid'] = data.get('uid')
-        if get_component_type(Annotations) in data:
+        if self.registry.index.get_type_name(Annotations) in data:
             json_data['annotations'] = {'list': self.registry.create_component(Annotations, data).gen_json()}
-        if get_component_type(Rows) in data:
+        if self.registry.index.get_type_name(Rows) in data:
             json_data['rows'] = self.registry.create_component(Rows, data).gen_json()
-        if get_component_type(Templates) in data:
+        if self.registry.index.get_type_name(Templates) in data:
             json_data['templating'] = {
                 'list': self.registry.create_component(Templates, data).gen_json(),
                 'enable': True
@@ -15,7 +15,6 @@ from __future__ import annotations
 
 from typing import Any
 
-from grafana_dashboards.common import get_component_type
 from grafana_dashboards.components.axes import Yaxes
 from grafana_dashboards.components.base import ComponentRegistry, JsonGenerator, JsonListGenerator, ObjectJsonGenerator
 from grafana_dashboards.components.links import Links
@@ -59,7 +58,7 @@ class Graph(PanelsItemBase):
         })
         targets = self.data.get('targets', [])
         if 'target' in self.data:
-            targets.append(self.data['target'])
+            targets = [*targets, self.data['target']]
         self._create_component(panel_json, Targets, {'targets': targets})
         panel_json['nullPointMode'] = self.data.get('nullPointMode', 'null')
         grid_data = self.data.get('grid', {}) or {}
@@ -113,8 +112,9 @@ class Graph(PanelsItemBase):
         return panel_json
 
     def _create_component(self, panel_json: dict[str, Any], clazz: type[JsonGenerator], data: dict[str, Any]) -> None:
-        if get_component_type(clazz) in data:
-            panel_json[get_component_type(clazz)] = self.registry.create_component(clazz, data).gen_json()
+        type_name = self.registry.index.get_type_name(clazz)
+        if type_name in data:
+            panel_json[type_name] = self.registry.create_component(clazz, data).gen_json()
 
 
 class SingleStat(PanelsItemBase):
@@ -158,7 +158,7 @@ class SingleStat(PanelsItemBase):
         if 'valueMaps' in data:
             panel_json['valueMaps'] = [{'value': value, 'op': '=', 'text': text} for value, text in
                                        data['valueMaps'].items()]
-        if get_component_type(Links) in data:
+        if self.registry.index.get_type_name(Links) in data:
             panel_json['links'] = self.registry.create_component(Links, data).gen_json()
         return panel_json
 
@@ -13,10 +13,11 @@
 # limitations under the License.
 from __future__ import annotations
 
-from collections.abc import Generator
+from collections import ChainMap
+from collections.abc import Generator, Iterable
 from typing import Any
 
-from grafana_dashboards.components.base import ComponentBase, ComponentRegistry, get_placeholders
+from grafana_dashboards.components.base import ComponentBase, ComponentIndex, ComponentRegistry, get_placeholders
 from grafana_dashboards.components.dashboards import Dashboard
 from grafana_dashboards.context import Context
 
@@ -29,6 +30,12 @@ class Project(ComponentBase):
         self._placeholders = [placeholder for dashboard in self._get_dashboard_names()
                               for placeholder in get_placeholders(dashboard)]
 
+    @classmethod
+    def get_references(cls, definition: dict[str, Any], index: ComponentIndex) -> Iterable[tuple[type, str]]:
+        dashboards = (definition.get(index.get_type_name(cls)) or {}).get('dashboards', [])
+        # context values may hold inline components passed to dashboards through placeholders
+        return [(Dashboard, dashboard_name) for dashboard_name in dashboards] + list(super().get_references(definition, index))
+
     def _get_dashboard_names(self) -> list[str]:
         return self.data.get('dashboards', [])
 
@@ -36,9 +43,13 @@ class Project(ComponentBase):
         return [self.registry.get_component(Dashboard, dashboard_name) for dashboard_name in
                 self._get_dashboard_names()]
 
-    def get_contexts(self, context: dict[str, Any] | None = None) -> Generator[Context, Any, None]:
+    def count_contexts(self, context: dict[str, Any] | None = None) -> int:
+        if context is None:
+            context = {}
+        return Context.count_contexts(ChainMap(context, self.data), self._placeholders)
+
+    def get_contexts(self, context: dict[str, Any] | None = None,
+                     start: int = 0, stop: int | None = None) -> Generator[Context, Any, None]:
         if context is None:
             context = {}
-        data = self.data.copy()
-        data.update(context)
-        return Context.create_context(data, self._placeholders)
+        return Context.create_context(ChainMap(context, self.data), self._placeholders, start, stop)
@@ -13,7 +13,6 @@
 # limitations under the License.
 from typing import Any
 
-from grafana_dashboards.common import get_component_type
 from grafana_dashboards.components.base import ComponentRegistry, JsonListGenerator, ObjectJsonGenerator
 from grafana_dashboards.components.panels import Panels
 
@@ -45,6 +44,6 @@ class Row(RowsItemBase):
             'collapse': data.get('collapse', False),
             'panels': []
         })
-        if get_component_type(Panels) in data:
+        if self.registry.index.get_type_name(Panels) in data:
             row_json['panels'] = self.registry.create_component(Panels, data).gen_json()
         return row_json
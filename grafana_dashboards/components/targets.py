@@ -15,7 +15,6 @@ from __future__ import annotations
 
 from typing import Any
 
-from grafana_dashboards.common import get_component_type
 from grafana_dashboards.components.base import ComponentRegistry, JsonListGenerator, ObjectJsonGenerator
 from grafana_dashboards.context import Context
 from grafana_dashboards.errors import UnregisteredComponentError
@@ -32,7 +31,7 @@ class Targets(JsonListGenerator):
             super().gen_item_json(items, result_list)
         except UnregisteredComponentError:
             result_list.append(
-                self.registry.create_component(GraphiteTarget, {get_component_type(GraphiteTarget): items}).gen_json()
+                self.registry.create_component(GraphiteTarget, {self.registry.index.get_type_name(GraphiteTarget): items}).gen_json()
             )
 
 
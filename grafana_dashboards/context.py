@@ -13,38 +13,162 @@
 # limitations under the License.
 from __future__ import annotations
 
+import copy
+import functools
 import itertools
+import logging
+import math
 import re
 import string
-from collections.abc import Container, Generator, Iterable, Mapping
-from typing import Any, cast
+from abc import ABCMeta, abstractmethod
+from collections import ChainMap
+from collections.abc import Container, Generator, Iterable, Iterator, Mapping, MutableMapping, Sequence
+from typing import Any, NoReturn, cast
+
+from grafana_dashboards import errors
 
 __author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
 
+logger = logging.getLogger(__name__)
+
+_TEMPLATE_CACHE_SIZE = 1 << 16
+
+
+class Template:
+    """Format string parsed once into literal segments and references to context keys."""
+
+    __slots__ = ('source', 'segments', 'fields', 'is_simple', 'literal')
+
+    def __init__(self, source: str) -> None:
+        super().__init__()
+        self.source = source
+        self.segments: list[tuple[str, str | None]] = []
+        self.is_simple = True
+        literal = ''
+        for (literal_text, field_name, format_spec, conversion) in string.Formatter().parse(source):
+            literal += literal_text
+            if field_name is None:
+                continue
+            if not _is_simple_field(field_name, format_spec, conversion):
+                self.is_simple = False
+            self.segments.append((literal, field_name))
+            literal = ''
+        if literal or not self.segments:
+            self.segments.append((literal, None))
+        self.fields = [field_name for (_, field_name) in self.segments if field_name is not None]
+        # unescaped text of templates without any field
+        self.literal = literal if not self.fields else None
+
+    def render(self, values: list[str]) -> str:
+        parts = []
+        field_values = iter(values)
+        for (literal, field_name) in self.segments:
+            parts.append(literal)
+            if field_name is not None:
+                parts.append(next(field_values))
+        return ''.join(parts)
+
+    def expand(self, context: Mapping[str, Any]) -> str:
+        if self.literal is not None:
+            return self.literal
+        if not self.is_simple:
+            return string.Formatter().vformat(self.source, (), context)
+        return self.render([format(context[field_name], '') for field_name in self.fields])
+
+
+def _is_simple_field(field_name: str, format_spec: str | None, conversion: str | None) -> bool:
+    # anything beyond plain key lookup (attributes, indices, positional args, format specs or conversions)
+    # is left to string.Formatter itself
+    return (bool(field_name) and not format_spec and conversion is None and not field_name[0].isdecimal()
+            and not any(char in field_name for char in '.[{'))
+
+
+@functools.lru_cache(maxsize=_TEMPLATE_CACHE_SIZE)
+def compile_template(source: str) -> Template:
+    return Template(source)
+
+
+_placeholder_pattern = re.compile('{.*}')
+
+
+def _expand_string(to_expand: str, context: Mapping[str, Any]) -> Any:
+    if _placeholder_pattern.match(to_expand) and to_expand[1:-1] in context:
+        # sole placeholder is replaced by the value itself so that lists and dicts can be passed along
+        return context[to_expand[1:-1]]
+    return compile_template(to_expand).expand(context)
+
 
 class Context:
-    _pattern = re.compile('{.*}')
-    _context: Mapping[str, str] | None
+    _context: Mapping[str, Any] | None
 
-    def __init__(self, context: Mapping[str, str] | None = None) -> None:
+    def __init__(self, context: Mapping[str, Any] | None = None, parent: Context | None = None,
+                 defer_errors: bool = False) -> None:
         super().__init__()
-        if not context:
-            self._context = None
+        self._dependents: dict[str, set[str]] = {}
+        self._unresolved: set[str] = set()
+        if parent is None or parent._context is None:
+            self._parent = None
+            self._values: MutableMapping[str, Any] = dict(context) if context else {}
+            self._keys: Iterable[str] = self._values.keys()
+            if not context:
+                self._context = None
+            else:
+                self._context = self._resolve(PlaceholderResolver(self._values), defer_errors)
         else:
-            self._context = DictDefaultingToPlaceholder(context)
+            # only values defined by this layer and those depending on them are resolved again,
+            # everything else is shared with the parent context
+            self._parent = parent
+            self._values = ChainMap(dict(context) if context else {}, parent._values)
+            self._keys = parent._get_dependents(itertools.chain(context or {}, parent._unresolved))
+            resolver = PlaceholderResolver(self._values, self._keys, parent._context)
+            self._context = LayeredContext(self._resolve(resolver, defer_errors), parent._context)
+
+    def _resolve(self, resolver: PlaceholderResolver, defer_errors: bool) -> DictDefaultingToPlaceholder:
+        resolved = resolver.resolve_all(defer_errors)
+        self._unresolved = resolver.unresolved
+        for (key, dependencies) in resolver.dependencies.items():
+            for dependency in dependencies:
+                self._dependents.setdefault(dependency, set()).add(key)
+        return resolved
+
+    def _get_dependents(self, keys: Iterable[str]) -> set[str]:
+        result: set[str] = set()
+        to_visit = list(keys)
+        while to_visit:
+            key = to_visit.pop()
+            if key in result:
+                continue
+            result.add(key)
+            context: Context | None = self
+            while context is not None:
+                to_visit.extend(context._dependents.get(key, ()))
+                context = context._parent
+        return result
+
+    def record_reads(self, keys: set[str]) -> Context:
+        """Returns copy of this context adding every key it looks up to keys."""
+        recording = copy.copy(self)
+        if self._context is not None:
+            recording._context = _RecordingMapping(self._context, keys)
+        return recording
+
+    def get_values(self, keys: Iterable[str]) -> tuple[Any, ...] | None:
+        """Returns hashable snapshot of values of keys, raises TypeError when some value cannot be hashed.
+
+        Empty context expands no placeholders at all, even escaped braces are kept, so None is returned for it.
+        """
+        if self._context is None:
+            return None
+        return tuple(_freeze(self._context[key]) if key in self._context else _MISSING for key in keys)
 
     def expand_placeholders(self, to_expand: Any) -> Any:
-        if not self._context:
+        if self._context is None:
             return to_expand
 
         if isinstance(to_expand, str):
-            (result, to_expand) = self._expand(to_expand)
-            while result != to_expand:
-                (result, to_expand) = self._expand(result)
-            if isinstance(result, str):
-                return string.Formatter().vformat(result, (), self._context)
-            else:
-                return result
+            return _expand_string(to_expand, self._context)
+        elif isinstance(to_expand, (StaticList, StaticDict)):
+            return to_expand
         elif isinstance(to_expand, list):
             return [self.expand_placeholders(value) for value in to_expand]
         elif isinstance(to_expand, dict):
@@ -52,22 +176,141 @@ class Context:
         else:
             return to_expand
 
-    def _expand(self, to_expand: str | Any) -> tuple[str, str | Any]:
-        context = cast(Mapping[str, str], self._context)  # at this point context is always Mapping
-        if not isinstance(to_expand, str):
-            return to_expand, to_expand
-        elif self._pattern.match(to_expand) and to_expand[1:-1] in context:
-            return context[to_expand[1:-1]], to_expand
-        escaped = to_expand.replace('{{', '{{{{').replace('}}', '}}}}')
-        return string.Formatter().vformat(escaped, (), context), to_expand
-
     def __str__(self) -> str:
         return str(self._context)
 
     @staticmethod
-    def create_context(data: Any, keys_to_expand: Container[str] | None = None) -> Generator[Context, Any, None]:
-        return (Context(Context(context).expand_placeholders(context))
-                for context in ContextExpander(keys_to_expand).create_context(None, data))
+    def count_contexts(data: Any, keys_to_expand: Container[str] | None = None) -> int:
+        return ContextExpander(keys_to_expand).count_contexts(None, data)
+
+    @staticmethod
+    def create_context(data: Any, keys_to_expand: Container[str] | None = None,
+                       start: int = 0, stop: int | None = None) -> Generator[Context, Any, None]:
+        (shared, combinations) = ContextExpander(keys_to_expand).create_layers(data)
+        # values are resolved, expanded and resolved once more, the shared part only once for all contexts;
+        # shared values that cannot be resolved on their own are left to the contexts that override or use them
+        shared_context = Context(shared, defer_errors=True)
+        expanded_shared = {}
+        templated_keys = set(shared_context._unresolved)
+        for (key, value) in shared.items():
+            if key in templated_keys:
+                continue
+            if not isinstance(value, str) and _has_braces(value):
+                templated_keys.add(key)
+            try:
+                expanded_shared[key] = shared_context.expand_placeholders(value)
+            except Exception:
+                templated_keys.add(key)
+        expanded_shared_context = Context(expanded_shared, defer_errors=True)
+        for context in combinations.iterate(start, stop):
+            layer = Context(context, shared_context)
+            expanded = {key: layer.expand_placeholders(layer._values[key])
+                        for key in itertools.chain(layer._keys, templated_keys) if key in layer._values}
+            yield Context(expanded, expanded_shared_context)
+
+
+class _RecordingMapping(Mapping[str, Any]):
+    def __init__(self, context: Mapping[str, Any], keys: set[str]) -> None:
+        super().__init__()
+        self._context = context
+        self._keys = keys
+
+    def __getitem__(self, key: str) -> Any:
+        self._keys.add(key)
+        return self._context[key]
+
+    def __contains__(self, key: object) -> bool:
+        self._keys.add(cast(str, key))
+        return key in self._context
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._context)
+
+    def __len__(self) -> int:
+        return len(self._context)
+
+
+_MISSING = object()
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, (list, tuple)):
+        return type(value), tuple(_freeze(item) for item in value)
+    elif isinstance(value, Mapping):
+        return type(value), tuple((key, _freeze(item)) for (key, item) in value.items())
+    hash(value)
+    return type(value), value
+
+
+def _read_only(self: object, *args: Any, **kwargs: Any) -> NoReturn:
+    raise TypeError(f"'{type(self).__name__}' object is read-only")
+
+
+class FrozenList(list[Any]):
+    """List that cannot be modified, component data is shared by all renders."""
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return type(self), (list(self),)
+
+
+class FrozenDict(dict[Any, Any]):
+    """Dict that cannot be modified, component data is shared by all renders."""
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return type(self), (dict(self),)
+
+
+class StaticList(FrozenList):
+    """List without any placeholder in it, shared by all its expansions."""
+
+
+class StaticDict(FrozenDict):
+    """Dict without any placeholder in its values, shared by all its expansions."""
+
+
+class LazyValue(metaclass=ABCMeta):
+    """Value loaded only when it is first frozen."""
+
+    @abstractmethod
+    def resolve(self) -> Any:
+        """Returns the read-only value."""
+
+
+def freeze(data: Any) -> Any:
+    """Returns read-only copy of data, lists and dicts that contain no placeholder are StaticList and StaticDict."""
+    if isinstance(data, (FrozenList, FrozenDict)):
+        return data
+    elif isinstance(data, LazyValue):
+        return data.resolve()
+    elif isinstance(data, list):
+        items = [freeze(value) for value in data]
+        return StaticList(items) if all(_is_static(value) for value in items) else FrozenList(items)
+    elif isinstance(data, dict):
+        values = {key: freeze(value) for (key, value) in data.items()}
+        return StaticDict(values) if all(_is_static(value) for value in values.values()) else FrozenDict(values)
+    return data
+
+
+def _is_static(value: Any) -> bool:
+    if isinstance(value, str):
+        return '{' not in value and '}' not in value
+    return not isinstance(value, (list, dict)) or isinstance(value, (StaticList, StaticDict))
+
+
+def _has_braces(value: Any) -> bool:
+    if isinstance(value, str):
+        return '{' in value or '}' in value
+    elif isinstance(value, list):
+        return any(_has_braces(item) for item in value)
+    elif isinstance(value, dict):
+        return any(_has_braces(item) for item in value.values())
+    return False
 
 
 class DictDefaultingToPlaceholder(dict[str, Any]):
@@ -75,32 +318,247 @@ class DictDefaultingToPlaceholder(dict[str, Any]):
         return '{' + key + '}'
 
 
+class LayeredContext(DictDefaultingToPlaceholder):
+    """Values of one context layer looked up before falling back to the shared parent layer."""
+
+    def __init__(self, values: Mapping[str, Any], parent: Mapping[str, Any]) -> None:
+        super().__init__(values)
+        self._parent = parent
+
+    def __missing__(self, key: str) -> Any:
+        return self._parent[key]
+
+    def __contains__(self, key: object) -> bool:
+        return dict.__contains__(self, key) or key in self._parent
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({dict.__repr__(self)}, {self._parent!r})'
+
+
+class PlaceholderResolver(DictDefaultingToPlaceholder):
+    """Resolves placeholders referencing other context values, each value exactly once in dependency order."""
+
+    def __init__(self, context: Mapping[str, Any], keys: Iterable[str] | None = None,
+                 resolved: Mapping[str, Any] | None = None) -> None:
+        super().__init__()
+        self._values = context
+        self._keys = self._values.keys() if keys is None else set(keys)
+        self._resolved = resolved if resolved is not None else {}
+        self._resolving: list[str] = []
+        self.dependencies: dict[str, set[str]] = {}
+        self.unresolved: set[str] = set()
+
+    def resolve_all(self, defer_errors: bool = False) -> DictDefaultingToPlaceholder:
+        for key in self._keys:
+            if key not in self._values:
+                continue
+            try:
+                self[key]
+            except Exception:
+                if not defer_errors:
+                    raise
+                self._resolving.clear()
+                self.unresolved.add(key)
+        return DictDefaultingToPlaceholder(self)
+
+    def _add_dependency(self, key: object) -> None:
+        if self._resolving:
+            self.dependencies.setdefault(self._resolving[-1], set()).add(cast(str, key))
+
+    def __contains__(self, key: object) -> bool:
+        self._add_dependency(key)
+        return key in self._values
+
+    def __getitem__(self, key: str) -> Any:
+        self._add_dependency(key)
+        return super().__getitem__(key)
+
+    def __missing__(self, key: str) -> Any:
+        if key not in self._values:
+            return super().__missing__(key)
+        if key not in self._keys:
+            return self._resolved[key]
+        if key in self._resolving:
+            cycle = self._resolving[self._resolving.index(key):] + [key]
+            raise errors.CyclicPlaceholderError(
+                f"Placeholder '{key}' references itself: {' -> '.join(cycle)}")
+        value = self._values[key]
+        if isinstance(value, str) and value != '{' + key + '}':
+            # value consisting only of its own placeholder is passed along unresolved
+            self._resolving.append(key)
+            try:
+                value = _expand_string(value, self)
+            except ValueError:
+                # not a valid format string, values that are never expanded must not break the build
+                logger.debug("Cannot resolve placeholders in '%s' value '%s'", key, value)
+            finally:
+                self._resolving.pop()
+        self[key] = value
+        return value
+
+
+_ContextPart = tuple[object, object, object]
+
+
+class ContextCombinations:
+    """Contexts created for the varying parts of the data, addressed by ordinal.
+
+    Combination is a tuple of indices into contexts created for each varying part, its ordinal is the mixed-radix
+    number with a digit per part. Ordinals follow the order in which the contexts are generated.
+    """
+
+    def __init__(self, expander: ContextExpander, shared: dict[Any, Any], parts: list[dict[Any, Any] | _ContextPart]) -> None:
+        super().__init__()
+        self._expander = expander
+        self._shared = shared
+        self._parts = parts
+        self._varying = [part for part in parts if isinstance(part, tuple)]
+        self.radices = tuple(expander.count_contexts(*part) for part in self._varying)
+        self.count = math.prod(self.radices)
+
+    def encode(self, indices: Sequence[int]) -> int:
+        if len(indices) != len(self.radices):
+            raise IndexError(f'Combination {tuple(indices)} must have {len(self.radices)} indices')
+        ordinal = 0
+        for (index, radix) in zip(indices, self.radices):
+            if not 0 <= index < radix:
+                raise IndexError(f'Combination {tuple(indices)} out of range {self.radices}')
+            ordinal = ordinal * radix + index
+        return ordinal
+
+    def decode(self, ordinal: int) -> tuple[int, ...]:
+        if not 0 <= ordinal < self.count:
+            raise IndexError(f'Combination ordinal {ordinal} out of range {self.count}')
+        indices = []
+        for radix in reversed(self.radices):
+            (ordinal, index) = divmod(ordinal, radix)
+            indices.append(index)
+        return tuple(reversed(indices))
+
+    def __getitem__(self, ordinal: int) -> dict[Any, Any]:
+        return self._merge(next(self._expander._product(self._varying, self.decode(ordinal))))
+
+    def __iter__(self) -> Iterator[dict[Any, Any]]:
+        return self.iterate()
+
+    def iterate(self, start: int = 0, stop: int | None = None) -> Generator[dict[Any, Any], Any, None]:
+        if stop is not None:
+            stop = min(stop, self.count)
+        if start >= (self.count if stop is None else stop):
+            return
+        contexts = self._expander._product(self._varying, self.decode(start))
+        for context in itertools.islice(contexts, None if stop is None else stop - start):
+            yield self._merge(context)
+
+    def _merge(self, context: tuple[dict[Any, Any], ...]) -> dict[Any, Any]:
+        result = self._expander._merge(context)
+        if not self._shared.keys().isdisjoint(result):
+            # shared and varying values collide, resolve precedence on all of them together
+            combination = iter(context)
+            result = self._expander._merge([part if isinstance(part, dict) else next(combination) for part in self._parts])
+        return result
+
+
 class ContextExpander:
     def __init__(self, keys_to_expand: Container[str] | None = None) -> None:
         super().__init__()
         self._keys_to_expand = keys_to_expand if keys_to_expand else []
 
-    def create_context(self, key: object, value: object, parent: object = None) -> Generator[dict[Any, Any], Any, None]:
-        contexts: list[Iterable[dict[Any, Any]]] = []
+    def count_contexts(self, key: object, value: object, parent: object = None) -> int:
+        """Returns the exact number of contexts create_context would generate, without generating them."""
         if isinstance(value, list):
             if key in self._keys_to_expand:
-                contexts.append(context for data in value for context in self.create_context(key, data, key))
+                return sum(self.count_contexts(key, data, key) for data in value)
+            return 1
+        elif isinstance(value, Mapping):
+            return math.prod(self.count_contexts(*part) for part in self._get_parts(value, parent))
+        return 1
+
+    def create_layers(self, data: object) -> tuple[dict[Any, Any], ContextCombinations]:
+        """Splits contexts created from data into values shared by all of them and values specific to each one."""
+        if not isinstance(data, Mapping):
+            return {}, ContextCombinations(self, {}, [(None, data, None)])
+        shared_parts: list[dict[Any, Any]] = []
+        parts: list[dict[Any, Any] | _ContextPart] = []
+        for (key, value) in data.items():
+            if self.count_contexts(key, value) == 1:
+                part = next(self.create_context(key, value))
+                shared_parts.append(part)
+                parts.append(part)
             else:
-                contexts.append(itertools.repeat({key: value}, 1))
-        elif isinstance(value, dict):
-            for (sub_key, sub_value) in value.items():
-                if parent and len(value) == 1:
-                    contexts.append(self.create_context(parent, sub_key))
-                contexts.append(self.create_context(sub_key, sub_value))
-        else:
-            contexts.append(itertools.repeat({key: value}, 1))
-        for context in itertools.product(*contexts):
-            result = {}
-            multi = {}
-            for context_part in context:
-                if len(context_part) == 1:
-                    result.update(context_part)
-                else:
-                    multi.update(context_part)
-            result.update(multi)
-            yield result
+                parts.append((key, value, None))
+        shared = self._merge(shared_parts)
+        return shared, ContextCombinations(self, shared, parts)
+
+    def create_context(self, key: object, value: object, parent: object = None, start: int = 0) -> Generator[dict[Any, Any], Any, None]:
+        """Generates contexts created from value, skipping the first start of them without generating them."""
+        if isinstance(value, list) and key in self._keys_to_expand:
+            for data in value:
+                if start:
+                    count = self.count_contexts(key, data, key)
+                    if start >= count:
+                        start -= count
+                        continue
+                yield from self.create_context(key, data, key, start)
+                start = 0
+        elif isinstance(value, Mapping):
+            parts = self._get_parts(value, parent)
+            digits = [0] * len(parts)
+            if start:
+                radices = [self.count_contexts(*part) for part in parts]
+                if start >= math.prod(radices):
+                    return
+                for position in reversed(range(len(parts))):
+                    (start, digits[position]) = divmod(start, radices[position])
+            for context in self._product(parts, digits):
+                yield self._merge(context)
+        elif not start:
+            yield {key: value}
+
+    @staticmethod
+    def _get_parts(value: Mapping[Any, Any], parent: object) -> list[_ContextPart]:
+        parts: list[_ContextPart] = []
+        for (sub_key, sub_value) in value.items():
+            if parent and len(value) == 1:
+                parts.append((parent, sub_key, None))
+            parts.append((sub_key, sub_value, None))
+        return parts
+
+    def _product(self, parts: list[_ContextPart], digits: Sequence[int]) -> Generator[tuple[dict[Any, Any], ...], Any, None]:
+        """Cartesian product of contexts created for parts in itertools.product order, starting at digits.
+
+        Unlike itertools.product inputs are never materialized, an exhausted part is created again
+        when the preceding one advances (odometer-style).
+        """
+        iterators = [self.create_context(*part, start=digit) for (part, digit) in zip(parts, digits)]
+        current = []
+        for iterator in iterators:
+            item = next(iterator, None)
+            if item is None:
+                return
+            current.append(item)
+        while True:
+            yield tuple(current)
+            position = len(iterators) - 1
+            while position >= 0:
+                item = next(iterators[position], None)
+                if item is not None:
+                    current[position] = item
+                    break
+                iterators[position] = self.create_context(*parts[position])
+                current[position] = next(iterators[position])
+                position -= 1
+            else:
+                return
+
+    @staticmethod
+    def _merge(context_parts: Iterable[dict[Any, Any]]) -> dict[Any, Any]:
+        result = {}
+        multi = {}
+        for context_part in context_parts:
+            if len(context_part) == 1:
+                result.update(context_part)
+            else:
+                multi.update(context_part)
+        result.update(multi)
+        return result
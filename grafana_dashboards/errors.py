@@ -28,3 +28,23 @@ class WrongComponentAttributeCountError(DashboardBuilderException):
 
 class UnregisteredComponentError(DashboardBuilderException):
     pass
+
+
+class CyclicPlaceholderError(DashboardBuilderException):
+    pass
+
+
+class ContextLimitExceededError(DashboardBuilderException):
+    pass
+
+
+class IncludeCycleError(DashboardBuilderException):
+    pass
+
+
+class BundleFormatError(DashboardBuilderException):
+    pass
+
+
+class ExportError(DashboardBuilderException):
+    pass
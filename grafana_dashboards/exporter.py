@@ -14,18 +14,36 @@
 from __future__ import annotations
 
 import errno
+import hashlib
 import json
 import logging
-from collections.abc import Iterable
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections.abc import Callable, Generator, Iterable
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
 from typing import Any
 
+from grafana_dashboards import errors
+from grafana_dashboards.common import get_component_type
+from grafana_dashboards.components.base import ComponentRegistry
 from grafana_dashboards.components.projects import Project
 
 __author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
 
 logger = logging.getLogger(__name__)
 
+_EXPORT_QUEUE_SIZE = 64
+_EXPORT_POLL_INTERVAL = 0.1
+_RENDER_WINDOW_PER_JOB = 2
+_FILE_MANIFEST = '.grafana-dashboard-builder.manifest'
+
+_Export = Callable[[str, str, Any], None]
+
 
 class DashboardExporter:
     def __init__(self, **kwargs: dict[str, Any]):
@@ -34,27 +52,214 @@ class DashboardExporter:
     def process_dashboard(self, project_name: str, dashboard_name: str, dashboard_data: dict[str, str]) -> None:
         pass
 
+    def close(self, completed: bool = True) -> None:
+        """Called after the last dashboard, finishes any work still in progress.
+
+        completed is False when rendering or export failed and not all dashboards were processed.
+        """
+
 
 class ProjectProcessor:
 
-    def __init__(self, dashboard_processors: list[DashboardExporter]) -> None:
+    def __init__(self, dashboard_processors: list[DashboardExporter], max_contexts: int | None = None, jobs: int = 1,
+                 export_queue_size: int = _EXPORT_QUEUE_SIZE) -> None:
         super().__init__()
         self._dashboard_processors = dashboard_processors
+        self._max_contexts = max_contexts
+        self._jobs = jobs
+        self._export_queue_size = export_queue_size
 
     def process_projects(self, projects: Iterable[Project], parent_context: dict[str, Any] | None = None) -> None:
+        projects = list(projects)
+        counts = [self._check_contexts(project, parent_context) for project in projects]
+        pipeline = None
+        if self._export_queue_size > 0 and self._dashboard_processors:
+            pipeline = _ExportPipeline(self._dashboard_processors, self._export_queue_size)
+        export = self._export if pipeline is None else pipeline.put
+        completed = False
+        try:
+            if self._jobs > 1 and sum(counts) > 1:
+                self._process_parallel(projects, counts, parent_context, export)
+            else:
+                self._process_serial(projects, parent_context, export)
+            completed = True
+        finally:
+            if pipeline is not None:
+                pipeline.close(completed)
+        if pipeline is not None:
+            pipeline.raise_error()
+        else:
+            for processor in self._dashboard_processors:
+                processor.close()
+
+    def _process_serial(self, projects: list[Project], parent_context: dict[str, Any] | None, export: _Export) -> None:
         for project in projects:
             logger.info("Processing project '%s'", project.name)
             for context in project.get_contexts(parent_context):
                 for dashboard in project.get_dashboards():
                     json_obj = dashboard.gen_json(context)
-                    dashboard_name = context.expand_placeholders(dashboard.name)
-                    for processor in self._dashboard_processors:
-                        processor.process_dashboard(project.name, dashboard_name, json_obj)
+                    export(project.name, context.expand_placeholders(dashboard.name), json_obj)
+
+    def _process_parallel(self, projects: list[Project], counts: list[int], parent_context: dict[str, Any] | None, export: _Export) -> None:
+        """Renders ranges of contexts in a pool of processes, dashboards are exported in the same order as serially."""
+        chunk_size = max(1, math.ceil(sum(counts) / (self._jobs * 4)))
+        units = [(index, start, min(start + chunk_size, count))
+                 for (index, count) in enumerate(counts) for start in range(0, count, chunk_size)]
+        costs = {unit: (unit[2] - unit[1]) * len(projects[unit[0]].get_dashboards()) for unit in units}
+        window = self._jobs * _RENDER_WINDOW_PER_JOB
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        executor = ProcessPoolExecutor(max_workers=self._jobs, mp_context=context, initializer=_initialize_worker,
+                                       initargs=(projects[0].registry.get_definitions(), [project.name for project in projects], parent_context))
+        try:
+            # only a window of units is rendered ahead of the export, the longest among the next units is started first
+            pending = list(units)
+            futures: dict[tuple[int, int, int], Future[list[tuple[str, Any]]]] = {}
+            processed = None
+            for unit in units:
+                while pending and (len(futures) < window or unit not in futures):
+                    submitted = unit if unit not in futures and len(futures) >= window else max(pending[:window], key=costs.__getitem__)
+                    pending.remove(submitted)
+                    futures[submitted] = executor.submit(_render_unit, *submitted)
+                project = projects[unit[0]]
+                if processed is not project:
+                    logger.info("Processing project '%s'", project.name)
+                    processed = project
+                for (dashboard_name, json_obj) in futures.pop(unit).result():
+                    export(project.name, dashboard_name, json_obj)
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def _export(self, project_name: str, dashboard_name: str, json_obj: Any) -> None:
+        for processor in self._dashboard_processors:
+            processor.process_dashboard(project_name, dashboard_name, json_obj)
+
+    def _check_contexts(self, project: Project, parent_context: dict[str, Any] | None) -> int:
+        count = project.count_contexts(parent_context)
+        dashboards = project.get_dashboards()
+        logger.info("Project '%s' expands to %s contexts, %s dashboards to generate", project.name, count, count * len(dashboards))
+        if self._max_contexts is not None and count > self._max_contexts:
+            raise errors.ContextLimitExceededError(f"Project '{project.name}' expands to {count} contexts,"
+                                                   f" more than the limit of {self._max_contexts}")
+        return count
+
+
+class _ExportPipeline:
+    """Each exporter consumes rendered dashboards in a thread of its own through a bounded queue.
+
+    Rendering is blocked while any queue is full. When an exporter fails, rendering stops and the other exporters
+    still process dashboards already queued for them.
+    """
+
+    def __init__(self, processors: list[DashboardExporter], queue_size: int) -> None:
+        super().__init__()
+        self._processors = processors
+        self._queues: list[queue.Queue[tuple[str, str, Any] | None]] = [queue.Queue(queue_size) for _ in processors]
+        self._counts = [0] * len(processors)
+        self._durations = [0.0] * len(processors)
+        self._errors: list[BaseException | None] = [None] * len(processors)
+        self._threads = [threading.Thread(target=self._consume, args=(index,), name=f'exporter-{get_component_type(type(processor))}', daemon=True)
+                         for (index, processor) in enumerate(processors)]
+        self._started = time.monotonic()
+        self._completed = False
+
+    def put(self, project_name: str, dashboard_name: str, json_obj: Any) -> None:
+        # threads are started with the first dashboard, after worker processes of parallel rendering are forked
+        if self._threads[0].ident is None:
+            for thread in self._threads:
+                thread.start()
+        if not all([self._put(index, (project_name, dashboard_name, json_obj)) for index in range(len(self._processors))]):
+            self.raise_error()
+
+    def close(self, completed: bool = True) -> None:
+        self._completed = completed
+        for (index, thread) in enumerate(self._threads):
+            if thread.ident is not None:
+                self._put(index, None)
+                thread.join()
+            else:
+                # exporters that got no dashboards are still closed, e.g. to remove stale files
+                self._close_processor(index)
+        for (index, processor) in enumerate(self._processors):
+            logger.info("Exporter '%s' processed %s dashboards in %.2fs%s", get_component_type(type(processor)), self._counts[index],
+                        self._durations[index], ', failed' if self._errors[index] is not None else '')
+        logger.info('Rendering and export finished in %.2fs', time.monotonic() - self._started)
+
+    def raise_error(self) -> None:
+        for error in self._errors:
+            if error is not None:
+                raise error
+
+    def _put(self, index: int, item: tuple[str, str, Any] | None) -> bool:
+        """Returns False when the exporter failed and does not take any more dashboards."""
+        while self._errors[index] is None:
+            try:
+                self._queues[index].put(item, timeout=_EXPORT_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _consume(self, index: int) -> None:
+        processor = self._processors[index]
+        try:
+            while (item := self._queues[index].get()) is not None:
+                started = time.monotonic()
+                try:
+                    processor.process_dashboard(*item)
+                except BaseException as e:
+                    logger.error("Exporter '%s' failed to process dashboard '%s': %s", get_component_type(type(processor)), item[1], e)
+                    self._errors[index] = e
+                    return
+                finally:
+                    self._durations[index] += time.monotonic() - started
+                self._counts[index] += 1
+        finally:
+            self._close_processor(index)
+
+    def _close_processor(self, index: int) -> None:
+        processor = self._processors[index]
+        started = time.monotonic()
+        try:
+            processor.close(self._completed and self._errors[index] is None)
+        except BaseException as e:
+            logger.error("Exporter '%s' failed to finish: %s", get_component_type(type(processor)), e)
+            if self._errors[index] is None:
+                self._errors[index] = e
+        self._durations[index] += time.monotonic() - started
+
+
+def _render(project: Project, parent_context: dict[str, Any] | None, start: int, stop: int) -> Generator[tuple[str, Any], Any, None]:
+    for context in project.get_contexts(parent_context, start, stop):
+        for dashboard in project.get_dashboards():
+            yield context.expand_placeholders(dashboard.name), dashboard.gen_json(context)
+
+
+_worker_projects: list[Project] = []
+_worker_context: dict[str, Any] | None = None
+
+
+def _initialize_worker(definitions: dict[str, dict[str, Any]], project_names: list[str], parent_context: dict[str, Any] | None) -> None:
+    """Creates registry of the worker process once, its components and render cache are reused by all units."""
+    global _worker_projects, _worker_context
+    registry = ComponentRegistry()
+    for (component_type, component_definitions) in definitions.items():
+        registry.add_definitions(component_type, component_definitions)
+    _worker_projects = [registry.get_component(Project, project_name) for project_name in project_names]
+    _worker_context = parent_context
+
+
+def _render_unit(project_index: int, start: int, stop: int) -> list[tuple[str, Any]]:
+    return list(_render(_worker_projects[project_index], _worker_context, start, stop))
 
 
 class FileExporter(DashboardExporter):
+    """Writes dashboards as JSON files, a file is replaced atomically and only when its content changed.
+
+    Hashes of written files are kept in a manifest, with remove_stale files of dashboards no longer generated by
+    the processed projects are removed after a completed run. Files not written by the exporter are never removed.
+    """
 
-    def __init__(self, output_folder: str) -> None:
+    def __init__(self, output_folder: str, remove_stale: bool = False, manifest: str | None = None) -> None:
         super().__init__()
         self._output_folder = output_folder
         path = Path(self._output_folder)
@@ -62,6 +267,18 @@ class FileExporter(DashboardExporter):
             path.mkdir(parents=True)
         if not path.is_dir():
             raise Exception(f"'{self._output_folder}' must be a directory")
+        self._remove_stale = remove_stale
+        self._manifest_path = Path(manifest) if manifest else path / _FILE_MANIFEST
+        self._manifest: dict[str, dict[str, Any]] = {}
+        try:
+            self._manifest = json.loads(self._manifest_path.read_text())
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable file manifest '%s': %s", self._manifest_path, e)
+        self._exported: set[str] = set()
+        self._projects: set[str] = set()
+        self._written = self._unchanged = 0
 
     def process_dashboard(self, project_name: str, dashboard_name: str, dashboard_data: dict[str, str]) -> None:
         super().process_dashboard(project_name, dashboard_name, dashboard_data)
@@ -73,6 +290,58 @@ class FileExporter(DashboardExporter):
                 raise
 
         dashboard_path = dirname / f'{dashboard_name}.json'
-        logger.info("Saving dashboard '%s' to '%s'", dashboard_name, str(dashboard_path.absolute()))
-        with open(dashboard_path, 'w') as f:
-            json.dump(dashboard_data, f, sort_keys=True, indent=2, separators=(',', ': '))
+        key = dashboard_path.relative_to(self._output_folder).as_posix()
+        content = json.dumps(dashboard_data, sort_keys=True, indent=2, separators=(',', ': ')).encode()
+        digest = hashlib.sha256(content).hexdigest()
+        self._exported.add(key)
+        self._projects.add(f'{Path(project_name).as_posix()}/')
+        if self._is_unchanged(dashboard_path, self._manifest.get(key), content, digest):
+            logger.debug("Dashboard '%s' in '%s' is unchanged", dashboard_name, str(dashboard_path.absolute()))
+            self._unchanged += 1
+        else:
+            logger.info("Saving dashboard '%s' to '%s'", dashboard_name, str(dashboard_path.absolute()))
+            temporary = dashboard_path.with_name(f'.{dashboard_path.name}.{os.getpid()}.tmp')
+            try:
+                temporary.write_bytes(content)
+                os.replace(temporary, dashboard_path)
+            finally:
+                temporary.unlink(missing_ok=True)
+            self._written += 1
+        stat = dashboard_path.stat()
+        self._manifest[key] = {'hash': digest, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    @staticmethod
+    def _is_unchanged(path: Path, entry: dict[str, Any] | None, content: bytes, digest: str) -> bool:
+        """Files not modified since they were written are compared by hash only, others by their content."""
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return False
+        if entry is not None and (entry['size'], entry['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+            return bool(entry['hash'] == digest)
+        return stat.st_size == len(content) and path.read_bytes() == content
+
+    def close(self, completed: bool = True) -> None:
+        removed = 0
+        if self._remove_stale and completed:
+            # files of projects not processed in this run, e.g. not selected by --project-name, are kept
+            stale = [key for key in set(self._manifest) - self._exported if any(key.startswith(project) for project in self._projects)]
+            for key in sorted(stale):
+                path = Path(self._output_folder) / key
+                logger.info("Removing stale dashboard '%s'", str(path.absolute()))
+                path.unlink(missing_ok=True)
+                del self._manifest[key]
+                removed += 1
+                try:
+                    path.parent.rmdir()
+                except OSError:
+                    pass
+        temporary = self._manifest_path.with_name(f'.{self._manifest_path.name}.{os.getpid()}.tmp')
+        try:
+            temporary.write_text(json.dumps(self._manifest, sort_keys=True, indent=2))
+            os.replace(temporary, self._manifest_path)
+        except OSError as e:
+            logger.warning("Cannot write file manifest '%s': %s", self._manifest_path, e)
+        finally:
+            temporary.unlink(missing_ok=True)
+        logger.info("Saved %s dashboards to '%s', %s unchanged, %s removed", self._written, self._output_folder, self._unchanged, removed)
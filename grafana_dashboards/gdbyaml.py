@@ -11,11 +11,18 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import locale
 import logging
+import mmap
+from collections import Counter
 from pathlib import Path
+from typing import Any
 
 import yaml
 
+from grafana_dashboards import errors
+from grafana_dashboards.context import LazyValue, freeze
+
 log = logging.getLogger(__name__)
 
 
@@ -31,27 +38,145 @@ class GDBLoaderMeta(type):
         return cls
 
 
-class GDBLoader(yaml.Loader, metaclass=GDBLoaderMeta):
-    """YAML Loader with `!include` constructor."""
+class IncludeResolver:
+    """Included files resolved once per absolute path, the read-only result is shared by every node including them.
+
+    Lazy resolver returns LazyInclude proxies, files are read only when the proxy is frozen.
+    counts holds the number of `!include` nodes that referenced each file.
+    """
+
+    def __init__(self, lazy: bool = False) -> None:
+        super().__init__()
+        self.lazy = lazy
+        self.counts = Counter()
+        self._resolved = {}
+        self._stack = []
+
+    def resolve(self, filename, loader):
+        """Returns content of filename and all files it includes, it is loaded by loader only the first time."""
+
+        self.counts[filename] += 1
+        if filename in self._resolved:
+            return self._resolved[filename]
+        if self.lazy:
+            resolved = self._resolved[filename] = (LazyInclude(filename, loader, self), [])
+            return resolved
+        if filename in self._stack:
+            cycle = ' -> '.join(str(path) for path in self._stack[self._stack.index(filename):] + [filename])
+            raise errors.IncludeCycleError(f'Cyclic include: {cycle}')
+        self._stack.append(filename)
+        try:
+            resolved = self._resolved[filename] = _load_include(filename, loader, self)
+        finally:
+            self._stack.pop()
+        return resolved
+
+
+class LazyInclude(LazyValue):
+    """Included file read and parsed when it is first frozen."""
+
+    _unresolved = object()
+
+    def __init__(self, filename, loader, includes=None):
+        super().__init__()
+        self.filename = filename
+        self._loader = loader
+        self._includes = IncludeResolver(lazy=True) if includes is None else includes
+        self._value = self._unresolved
+        self._resolving = False
+
+    def resolve(self):
+        if self._value is self._unresolved:
+            if self._resolving:
+                raise errors.IncludeCycleError(f"Cyclic include of '{self.filename}'")
+            self._resolving = True
+            try:
+                log.debug("Resolving lazy include '%s'", self.filename)
+                self._value = _load_include(self.filename, self._loader, self._includes)[0]
+            finally:
+                self._resolving = False
+        return self._value
+
+    def __reduce__(self):
+        return type(self), (self.filename, self._loader)
+
+    def __repr__(self):
+        return f'LazyInclude({str(self.filename)!r})'
+
 
-    def __init__(self, stream):
-        """Initialise Loader."""
+def _load_include(filename, loader, includes):
+    if filename.suffix.lstrip('.') not in ('yaml', 'yml'):
+        return _read_text(filename), []
+    with open(filename) as f:
+        instance = loader(f, includes)
+        try:
+            return freeze(instance.get_single_data()), instance.included_files
+        finally:
+            instance.dispose()
+
+
+def _read_text(filename):
+    with open(filename, 'rb') as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                text = content[:].decode(locale.getpreferredencoding(False))
+        except ValueError:
+            # empty files cannot be mapped
+            return ''
+    # same newline translation as for files opened in text mode
+    return text.replace('\r\n', '\n').replace('\r', '\n') if '\r' in text else text
+
+
+class GDBLoaderMixin:
+    """`!include` constructor resolving files relative to the loaded file."""
+
+    def __init__(self, stream, includes=None):
+        """Initialise Loader, includes are resolved by a new IncludeResolver unless one is given."""
 
         try:
             self._root = Path(stream.name).parent
         except AttributeError:
             self._root = Path('.')
+        self.included_files = []
+        self._includes = IncludeResolver() if includes is None else includes
 
         super().__init__(stream)
 
     def construct_include(self, node):
         """Include file referenced at node."""
 
+        # symlinks are not resolved, files included by a linked file are relative to the directory of the link
         filename = (self._root / self.construct_scalar(node)).absolute()
-        extension = filename.suffix.lstrip('.')
+        (value, included_files) = self._includes.resolve(filename, type(self))
+        if not self._includes.lazy:
+            # lazy includes are read only when resolved, their content is not part of this file
+            self.included_files.append(filename)
+            self.included_files.extend(included_files)
+        return value
+
+
+class GDBLoader(GDBLoaderMixin, yaml.Loader, metaclass=GDBLoaderMeta):
+    """YAML Loader with `!include` constructor."""
+
+
+if yaml.__with_libyaml__:
+    class GDBCLoader(GDBLoaderMixin, yaml.CLoader, metaclass=GDBLoaderMeta):
+        """libyaml based YAML Loader with `!include` constructor."""
+
+    FastGDBLoader = GDBCLoader
+else:
+    log.debug('libyaml is not available, using pure Python YAML loader')
+    FastGDBLoader = GDBLoader
+
+
+def load_all_with_includes(stream: Any, loader: type, includes: IncludeResolver | None = None) -> tuple[list[Any], list[Path]]:
+    """Load all documents in stream, returns them together with all files they include except lazy includes."""
 
-        with open(filename) as f:
-            if extension in ('yaml', 'yml'):
-                return yaml.load(f, GDBLoader)
-            else:
-                return ''.join(f.readlines())
+    instance = loader(stream, includes)
+    try:
+        documents = []
+        while instance.check_data():
+            documents.append(instance.get_data())
+        return documents, instance.included_files
+    finally:
+        instance.dispose()
@@ -11,32 +11,105 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from collections.abc import Generator, Iterable, Iterator
+import logging
+from collections import Counter
+from collections.abc import Collection, Generator, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 from typing import Any
 
-import yaml
-
+from grafana_dashboards.bundle import read_bundle, write_bundle
+from grafana_dashboards.cache import ParseCache
 from grafana_dashboards.components.base import ComponentRegistry
 from grafana_dashboards.components.projects import Project
-from grafana_dashboards.gdbyaml import GDBLoader
+from grafana_dashboards.gdbyaml import FastGDBLoader, IncludeResolver, load_all_with_includes
 
 __author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
 
+logger = logging.getLogger(__name__)
+
 
 class DefinitionParser:
-    def __init__(self) -> None:
+    def __init__(self, parse_cache: ParseCache | None = None, jobs: int = 1, lazy_includes: bool = False) -> None:
         super().__init__()
+        self._parse_cache = parse_cache
+        self._jobs = jobs
+        self._lazy_includes = lazy_includes
+
+    def load_projects(self, paths: Iterable[str], project_names: Collection[str] | None = None) -> Iterable[Project]:
+        return self._select_projects(self._load_registry(paths), project_names)
 
-    def load_projects(self, paths: Iterable[str]) -> Iterable[Project]:
+    def load_bundle(self, bundle_path: str | Path, project_names: Collection[str] | None = None) -> Iterable[Project]:
         registry = ComponentRegistry()
-        for path in paths:
-            with open(path) as fp:
-                for component in self._iter_over_all(yaml.load_all(fp, Loader=GDBLoader)):
-                    registry.add(component)
-        return registry[Project]
+        for (component_type, definitions) in read_bundle(bundle_path).items():
+            registry.add_definitions(component_type, definitions)
+        return self._select_projects(registry, project_names)
+
+    def compile_bundle(self, paths: Iterable[str], bundle_path: str | Path) -> None:
+        write_bundle(bundle_path, self._load_registry(paths).get_definitions())
+
+    def _load_registry(self, paths: Iterable[str]) -> ComponentRegistry:
+        registry = ComponentRegistry()
+        include_counts: Counter[Path] = Counter()
+        for documents in self._parse_all(list(paths), include_counts):
+            for component in self._iter_over_all(iter(documents)):
+                registry.add(component)
+        for (included, count) in include_counts.most_common():
+            logger.info("Included '%s' %s times", included, count)
+        return registry
+
+    @staticmethod
+    def _select_projects(registry: ComponentRegistry, project_names: Collection[str] | None) -> Iterable[Project]:
+        if project_names is None:
+            return registry[Project]
+        registry.retain_reachable((Project, project_name) for project_name in project_names)
+        return [registry.get_component(Project, project_name) for project_name in project_names]
+
+    def _parse_all(self, paths: list[str], include_counts: Counter[Path]) -> Generator[list[Any], Any, None]:
+        """Yields documents of each file in order of paths, parsed by a pool of processes when jobs is above 1."""
+        if self._jobs <= 1 or len(paths) <= 1:
+            includes = IncludeResolver(self._lazy_includes)
+            for path in paths:
+                yield _load_all(path, self._parse_cache, includes)
+            include_counts.update(includes.counts)
+            return
+        executor = ProcessPoolExecutor(max_workers=min(self._jobs, len(paths)), initializer=_initialize_worker,
+                                       initargs=(self._parse_cache, self._lazy_includes))
+        try:
+            chunk_size = max(1, len(paths) // (self._jobs * 4))
+            for (documents, counts) in executor.map(_parse, paths, chunksize=chunk_size):
+                include_counts.update(counts)
+                yield documents
+        finally:
+            executor.shutdown(cancel_futures=True)
 
     @staticmethod
     def _iter_over_all(documents: Iterator[Any]) -> Generator[Any, Any, None]:
         return (component
                 for document in documents
                 for component in document)
+
+
+_worker_parse_cache: ParseCache | None = None
+_worker_includes = IncludeResolver()
+
+
+def _initialize_worker(parse_cache: ParseCache | None, lazy_includes: bool) -> None:
+    """Creates include resolver of the worker process once, files included by several definition files are parsed only once."""
+    global _worker_parse_cache, _worker_includes
+    _worker_parse_cache = parse_cache
+    _worker_includes = IncludeResolver(lazy_includes)
+
+
+def _parse(path: str) -> tuple[list[Any], Counter[Path]]:
+    documents = _load_all(path, _worker_parse_cache, _worker_includes)
+    # counts are reported per file, the resolved includes are kept for next files
+    (counts, _worker_includes.counts) = (_worker_includes.counts, Counter())
+    return documents, counts
+
+
+def _load_all(path: str, parse_cache: ParseCache | None, includes: IncludeResolver) -> list[Any]:
+    if parse_cache is not None:
+        return parse_cache.load_all(path, FastGDBLoader, includes)
+    with open(path) as fp:
+        return load_all_with_includes(fp, FastGDBLoader, includes)[0]
@@ -11,12 +11,17 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import MagicMock, patch
 from urllib.request import Request
 
+import pytest
+import requests
 from requests_kerberos import HTTPKerberosAuth
 
-from grafana_dashboards.client.connection import BasicAuthConnection, BearerAuthConnection, KerberosConnection, SSLAuthConnection
+from grafana_dashboards.client.connection import BasicAuthConnection, BearerAuthConnection, ConnectionPool, KerberosConnection, SSLAuthConnection
 
 __author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
 
@@ -83,20 +88,23 @@ def test_connection_with_token():
     assert request.data.encode('utf-8') == capture.value.data
 
 
-@patch('requests.post')
+@patch('requests.Session.post')
 def test_connection_with_kerberos(post):
     connection = KerberosConnection('https://host')
 
     post().json.return_value = {'hello': 'world'}
 
+    assert connection.make_request('/uri', {'it\'s': 'alive'}) == {'hello': 'world'}
     assert connection.make_request('/uri', {'it\'s': 'alive'}) == {'hello': 'world'}
 
-    capture = Capture()
-    post.assert_called_with('https://host/uri', auth=capture, json={"it's": 'alive'}, verify=False)
-    assert isinstance(capture.value, HTTPKerberosAuth)
+    post.assert_called_with('https://host/uri', json={"it's": 'alive'})
+    # noinspection PyProtectedMember
+    session = connection._session
+    assert isinstance(session.auth, HTTPKerberosAuth)
+    assert session.verify is False
 
 
-@patch('requests.post')
+@patch('requests.Session.post')
 def test_connection_with_sslauth(post):
     connection = SSLAuthConnection('https://host', ('/fake/cert'))
 
@@ -104,4 +112,95 @@ def test_connection_with_sslauth(post):
 
     assert connection.make_request('/uri', {'it\'s': 'alive'}) == {'hello': 'world'}
 
-    post.assert_called_with('https://host/uri', json={"it's": 'alive'}, cert='/fake/cert')
+    post.assert_called_with('https://host/uri', json={"it's": 'alive'})
+    # noinspection PyProtectedMember
+    assert connection._session.cert == '/fake/cert'
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.clients.append(self.client_address)
+        body = json.dumps({'status': 'success'} if self.path != '/error' else {'message': 'error'}).encode()
+        self.send_response(200 if self.path != '/error' else 412)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        # simulates load balancer dropping idle connections without telling the client
+        self.close_connection = self.server.drop_connections
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _KeepAliveHandler)
+    server.clients = []
+    server.drop_connections = False
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_connection_reuses_connections(http_server):
+    connection = BasicAuthConnection('username', 'password', f'http://127.0.0.1:{http_server.server_port}')
+
+    for _ in range(5):
+        assert connection.make_request('/uri', {'it\'s': 'alive'}) == {'status': 'success'}
+
+    assert len(http_server.clients) == 5
+    assert len(set(http_server.clients)) == 1
+
+
+def test_connection_reconnects_stale_connections(http_server):
+    http_server.drop_connections = True
+    connection = BearerAuthConnection('token', f'http://127.0.0.1:{http_server.server_port}')
+
+    for _ in range(3):
+        assert connection.make_request('/uri', {'it\'s': 'alive'}) == {'status': 'success'}
+
+    assert len(set(http_server.clients)) == 3
+
+
+def test_connection_idle_timeout(http_server):
+    connection = BasicAuthConnection('username', 'password', f'http://127.0.0.1:{http_server.server_port}', idle_timeout=0)
+
+    for _ in range(3):
+        assert connection.make_request('/uri', {'it\'s': 'alive'}) == {'status': 'success'}
+
+    assert len(set(http_server.clients)) == 3
+
+
+def test_connection_pool_size():
+    pool = ConnectionPool(size=1)
+    connections = [MagicMock(), MagicMock()]
+
+    for connection in connections:
+        pool.release(('http', 'host'), connection)
+
+    connections[0].close.assert_not_called()
+    connections[1].close.assert_called_once_with()
+    assert pool.acquire(('http', 'host')) is connections[0]
+    assert pool.acquire(('http', 'host')) is None
+
+
+def test_session_connections_reused(http_server):
+    connection = SSLAuthConnection(f'http://127.0.0.1:{http_server.server_port}', None)
+
+    for _ in range(3):
+        assert connection.make_request('/uri', {'it\'s': 'alive'}) == {'status': 'success'}
+
+    assert len(set(http_server.clients)) == 1
+
+
+def test_session_error_response(http_server):
+    connection = SSLAuthConnection(f'http://127.0.0.1:{http_server.server_port}', None)
+
+    with pytest.raises(requests.HTTPError, match='412'):
+        connection.make_request('/error', {'it\'s': 'alive'})
@@ -12,8 +12,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import MagicMock
+from urllib.parse import parse_qs, urlparse
 
+import pytest
+import requests
+
+from grafana_dashboards import errors
+from grafana_dashboards.client import grafana
+from grafana_dashboards.client.connection import SSLAuthConnection
 from grafana_dashboards.client.grafana import GrafanaExporter
 
 __author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
@@ -56,3 +67,146 @@ def test_grafana_with_sslauth():
     # noinspection PyProtectedMember
     exporter._connection.make_request.assert_called_once_with('/api/dashboards/db',
                                                               body)
+
+
+class _GrafanaHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(0.05)
+        with server.lock:
+            server.in_flight -= 1
+            server.bodies.append((self.path, self.headers['Authorization'], body))
+        if body['dashboard']['title'] == 'broken':
+            self._respond(500, {'message': 'broken'})
+            return
+        uid = body['dashboard'].get('uid', f"generated-{body['dashboard']['title']}")
+        with server.lock:
+            server.dashboards[uid] = server.dashboards.get(uid, 0) + 1
+            version = server.dashboards[uid]
+        self._respond(200, {'status': 'success', 'uid': uid, 'version': version})
+
+    def do_GET(self):
+        if self.server.fail_search:
+            self._respond(500, {'message': 'search failed'})
+            return
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        (limit, page) = (int(query['limit'][0]), int(query['page'][0]))
+        with self.server.lock:
+            self.server.searches.append(page)
+            uids = sorted(self.server.dashboards)
+        self._respond(200, [{'uid': uid, 'type': 'dash-db'} for uid in uids[(page - 1) * limit:page * limit]])
+
+    def _respond(self, status, data):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(data).encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def grafana_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _GrafanaHandler)
+    server.lock = threading.Lock()
+    server.in_flight = server.max_in_flight = 0
+    server.bodies = []
+    server.dashboards = {}
+    server.searches = []
+    server.fail_search = False
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_grafana_concurrent_uploads(grafana_server):
+    exporter = GrafanaExporter(host=f'http://127.0.0.1:{grafana_server.server_port}', username='username', password='password',
+                               commit_message='message', concurrency=4)
+
+    for i in range(12):
+        exporter.process_dashboard('project_name', f'dashboard-{i}', {'title': f'title-{i}', 'uid': f'uid-{i}', 'folderId': i})
+    exporter.close()
+
+    assert 1 < grafana_server.max_in_flight <= 4
+    assert sorted(grafana_server.bodies, key=lambda request: request[2]['folderId']) == [
+        ('/api/dashboards/db', 'Basic dXNlcm5hbWU6cGFzc3dvcmQ=',
+         {'overwrite': True, 'dashboard': {'title': f'title-{i}', 'uid': f'uid-{i}', 'folderId': i}, 'message': 'message',
+          'folderId': i, 'uid': f'uid-{i}'})
+        for i in range(12)]
+
+
+def test_grafana_concurrent_upload_failure(grafana_server):
+    exporter = GrafanaExporter(host=f'http://127.0.0.1:{grafana_server.server_port}', username='username', password='password',
+                               concurrency=4)
+
+    for title in ['first', 'broken', 'last']:
+        exporter.process_dashboard('project_name', f'dashboard-{title}', {'title': title})
+    with pytest.raises(errors.ExportError, match='dashboard-broken$'):
+        exporter.close()
+
+    assert sorted(body['dashboard']['title'] for (_, _, body) in grafana_server.bodies) == ['broken', 'first', 'last']
+
+
+def _upload_dashboards(server, manifest, dashboards, concurrency=1):
+    exporter = GrafanaExporter(host=f'http://127.0.0.1:{server.server_port}', username='username', password='password',
+                               skip_unchanged=True, manifest=str(manifest), concurrency=concurrency)
+    server.bodies.clear()
+    server.searches.clear()
+    for dashboard in dashboards:
+        exporter.process_dashboard('project_name', f"dashboard-{dashboard['title']}", dashboard)
+    exporter.close()
+    return sorted(body['dashboard']['title'] for (_, _, body) in server.bodies)
+
+
+@pytest.mark.parametrize('concurrency', [1, 4])
+def test_grafana_skips_unchanged_dashboards(grafana_server, tmp_path, monkeypatch, concurrency):
+    monkeypatch.setattr(grafana, '_SEARCH_PAGE_SIZE', 2)
+    manifest = tmp_path / '.grafana' / 'manifest.json'
+    dashboards = [{'title': f'title-{i}', 'uid': f'uid-{i}'} for i in range(4)] + [{'title': 'no-uid', 'folderId': 1}]
+
+    assert _upload_dashboards(grafana_server, manifest, dashboards, concurrency) == ['no-uid', 'title-0', 'title-1', 'title-2', 'title-3']
+    assert json.loads(manifest.read_text())[f'http://127.0.0.1:{grafana_server.server_port}']['uid:uid-1']['version'] == 1
+
+    dashboards[1] = {'title': 'title-1', 'uid': 'uid-1', 'tags': ['changed']}
+    assert _upload_dashboards(grafana_server, manifest, dashboards, concurrency) == ['title-1']
+    assert grafana_server.searches == [1, 2, 3]
+
+    del grafana_server.dashboards['uid-2']
+    del grafana_server.dashboards['generated-no-uid']
+    assert _upload_dashboards(grafana_server, manifest, dashboards, concurrency) == ['no-uid', 'title-2']
+    assert json.loads(manifest.read_text())[f'http://127.0.0.1:{grafana_server.server_port}']['uid:uid-1']['version'] == 2
+
+
+def test_grafana_uploads_all_when_search_fails(grafana_server, tmp_path):
+    manifest = tmp_path / 'manifest.json'
+    dashboards = [{'title': 'first', 'uid': 'first'}, {'title': 'broken', 'uid': 'broken'}]
+
+    with pytest.raises(errors.ExportError):
+        _upload_dashboards(grafana_server, manifest, dashboards, concurrency=2)
+    assert list(json.loads(manifest.read_text()).values()) == [{'uid:first': {'hash': grafana.UploadManifest.get_hash(dashboards[0]),
+                                                                              'uid': 'first', 'version': 1}}]
+
+    assert _upload_dashboards(grafana_server, manifest, dashboards[:1], concurrency=2) == []
+    grafana_server.fail_search = True
+    assert _upload_dashboards(grafana_server, manifest, dashboards[:1], concurrency=2) == ['first']
+
+
+def test_grafana_does_not_record_failed_session_uploads(grafana_server, tmp_path):
+    host = f'http://127.0.0.1:{grafana_server.server_port}'
+    manifest = tmp_path / 'manifest.json'
+    exporter = GrafanaExporter(host=host, ssl_client_crt='/file/fake', skip_unchanged=True, manifest=str(manifest))
+    exporter._connection = SSLAuthConnection(host, None)
+
+    with pytest.raises(requests.HTTPError):
+        exporter.process_dashboard('project_name', 'dashboard-broken', {'title': 'broken', 'uid': 'broken'})
+    exporter.close()
+
+    assert json.loads(manifest.read_text()) == {host: {}}
@@ -11,10 +11,20 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import json
+from unittest.mock import patch
+
 import pytest
 
 from grafana_dashboards import errors
-from grafana_dashboards.components.base import ComponentBase, ComponentRegistry
+from grafana_dashboards.components import base
+from grafana_dashboards.components.base import ComponentBase, ComponentIndex, ComponentRegistry
+from grafana_dashboards.components.dashboards import Dashboard
+from grafana_dashboards.components.panels import Graph, Panels
+from grafana_dashboards.components.projects import Project
+from grafana_dashboards.components.rows import Rows
+from grafana_dashboards.components.targets import GraphiteTarget
+from grafana_dashboards.context import Context, freeze
 
 __author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
 
@@ -23,6 +33,23 @@ class TestBase(ComponentBase):
     __test__ = False
 
 
+class TestItemBase(ComponentBase):
+    __test__ = False
+
+
+class TestCounted(ComponentBase):
+    __test__ = False
+    created = 0
+
+    def __init__(self, data, registry):
+        super().__init__(data, registry)
+        TestCounted.created += 1
+
+
+class TestItem(TestItemBase):
+    __test__ = False
+
+
 def test_registry_unregistered_component():
     registry = ComponentRegistry()
 
@@ -74,3 +101,144 @@ def test_registry_add_component_duplicate_key():
     registry.add({'name': 'name', 'test-base': {}})
     with pytest.raises(errors.DuplicateKeyError):
         registry.add({'name': 'name', 'test-base': {}})
+
+
+def test_registry_caches_renders_by_read_values():
+    registry = ComponentRegistry()
+    registry.add({'name': 'cached', 'graphite-target': {'target': 'prefix.{metric}'}})
+    component = registry.get_component(GraphiteTarget, 'cached')
+
+    first = component.gen_json(Context({'metric': 'a', 'other': 'x'}))
+    second = component.gen_json(Context({'metric': 'a', 'other': 'y'}))
+    third = component.gen_json(Context({'metric': 'b', 'other': 'x'}))
+
+    assert first == {'target': 'prefix.a'}
+    assert second is first
+    assert third == {'target': 'prefix.b'}
+    assert registry.render_cache.hits == 1
+    assert registry.render_cache.misses == 2
+
+
+def test_registry_does_not_share_renders_of_empty_context():
+    registry = ComponentRegistry()
+    registry.add({'name': 'literal', 'graphite-target': {'target': 'prefix.{{literal}}'}})
+    component = registry.get_component(GraphiteTarget, 'literal')
+
+    assert component.gen_json() == {'target': 'prefix.{{literal}}'}
+    assert component.gen_json(Context({'metric': 'a'})) == {'target': 'prefix.{literal}'}
+    assert component.gen_json() == {'target': 'prefix.{{literal}}'}
+    assert registry.render_cache.hits == 1
+
+
+def test_index_includes_types_loaded_before_it_is_built():
+    index = ComponentIndex()
+
+    assert index.types['test-base'] is TestBase
+    assert index.get_type_name(TestItem) == 'test-item'
+    assert index.get_item_types([TestItemBase]) == {'test-item'}
+
+    class TestPluginItem(TestItemBase):
+        __test__ = False
+
+    assert index.get_item_types([TestItemBase]) == {'test-item'}
+    assert ComponentIndex().get_item_types([TestItemBase]) == {'test-item', 'test-plugin-item'}
+
+
+def test_registry_builds_components_from_static_data_once():
+    registry = ComponentRegistry()
+    static = freeze({'target': 'static'})
+    dynamic = freeze({'target': '{metric}'})
+
+    first = registry.create_component(GraphiteTarget, {'graphite-target': static})
+    assert registry.create_component(GraphiteTarget, {'graphite-target': static}) is first
+    assert first.gen_json() is first.gen_json()
+    assert registry.create_component(GraphiteTarget, {'graphite-target': dynamic}) is not \
+        registry.create_component(GraphiteTarget, {'graphite-target': dynamic})
+
+
+def test_registered_component_is_not_modified_by_rendering():
+    registry = ComponentRegistry()
+    registry.add({'name': 'graph', 'graph': {
+        'title': '{index}',
+        'target': 'target',
+        'targets': ['first', 'second'],
+        'yaxes': [{'yaxis': {'format': 'short'}}]
+    }})
+    graph = registry.get_component(Graph, 'graph')
+    data = graph.data
+
+    sizes = set()
+    with patch.object(base, 'freeze', wraps=freeze) as freeze_mock:
+        for index in range(1000):
+            json_data = graph.gen_json(Context({'index': f'{index:04d}'}))
+            sizes.add(len(json.dumps(json_data)))
+
+    assert json_data['title'] == '0999'
+    assert len(json_data['targets']) == 3
+    assert len(sizes) == 1
+    # registered data is frozen once and used by every render as it is
+    freeze_mock.assert_not_called()
+    assert graph.data is data
+    assert graph.data['targets'] == ['first', 'second']
+    with pytest.raises(TypeError):
+        graph.data['targets'].append('third')
+
+
+def test_copy_plan_shared_by_components_of_class():
+    registry = ComponentRegistry()
+    graphs = [registry.create_component(Graph, {'graph': {'title': '{index}'}}) for _ in range(2)]
+
+    assert graphs[0] is not graphs[1]
+    # noinspection PyProtectedMember
+    assert graphs[0]._get_copy_plan() is graphs[1]._get_copy_plan()
+
+
+def test_registry_creates_components_when_first_used():
+    registry = ComponentRegistry()
+    created = TestCounted.created
+
+    registry.add({'name': 'counted', 'test-counted': {}})
+    assert TestCounted.created == created
+
+    component = registry.get_component(TestCounted, 'counted')
+    assert registry.get_component(TestCounted, 'counted') is component
+    assert list(registry[TestCounted]) == [component]
+    assert TestCounted.created == created + 1
+
+
+def test_registry_retains_reachable_definitions():
+    registry = ComponentRegistry()
+    registry.add({'name': 'selected', 'project': {'dashboards': ['used']}})
+    registry.add({'name': 'other', 'project': {'dashboards': ['unused']}})
+    registry.add({'name': 'used', 'dashboard': {'rows': ['static', '{param}-row', {'with-context': {'param': 'value'}}]}})
+    registry.add({'name': 'unused', 'dashboard': {'rows': ['unused']}})
+    for row in ['static', 'first-row', 'second-row', 'with-context', 'unused']:
+        registry.add({'name': row, 'rows': [{'row': {'title': row}}]})
+
+    registry.retain_reachable([(Project, 'selected')])
+
+    assert [project.name for project in registry[Project]] == ['selected']
+    assert [dashboard.name for dashboard in registry[Dashboard]] == ['used']
+    assert [rows.name for rows in registry[Rows]] == ['static', 'first-row', 'second-row', 'with-context']
+
+
+def test_registry_retains_definitions_referenced_through_placeholder():
+    registry = ComponentRegistry()
+    registry.add({'name': 'selected', 'project': {'dashboards': ['used'], 'my-rows': ['shared', {'row': {'panels': ['inline-graph']}}]}})
+    registry.add({'name': 'other', 'project': {'dashboards': ['unused']}})
+    registry.add({'name': 'used', 'dashboard': {'rows': '{my-rows}'}})
+    registry.add({'name': 'unused', 'dashboard': {}})
+    for row in ['shared', 'other']:
+        registry.add({'name': row, 'rows': [{'row': {'title': row}}]})
+    for graph in ['inline-graph', 'unused-graph']:
+        registry.add({'name': graph, 'panels': [{'graph': {'title': graph}}]})
+
+    registry.retain_reachable([(Project, 'selected')])
+
+    assert [rows.name for rows in registry[Rows]] == ['shared', 'other']
+    assert [panels.name for panels in registry[Panels]] == ['inline-graph']
+    assert [dashboard.name for dashboard in registry[Dashboard]] == ['used']
+    [project] = registry[Project]
+    [dashboard] = project.get_dashboards()
+    [context] = project.get_contexts()
+    assert [row['title'] for row in dashboard.gen_json(context)['rows']] == ['shared', '']
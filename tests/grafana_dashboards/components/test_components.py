@@ -20,7 +20,7 @@ import yaml
 
 import grafana_dashboards.common
 from grafana_dashboards.components import *  # NOQA
-from grafana_dashboards.components.base import JsonListGenerator
+from grafana_dashboards.components.base import ComponentIndex, JsonListGenerator
 from grafana_dashboards.errors import UnregisteredComponentError
 
 __author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
@@ -54,6 +54,8 @@ def load_test_fixtures():
 
 def test_component(component, config, expected):
     with mock.patch('grafana_dashboards.components.base.ComponentRegistry') as registry:
+        registry.index = ComponentIndex()
+
         def create_component(component_type, data):
             gen = mock.Mock()
             if inspect.isclass(component_type) and issubclass(component_type, JsonListGenerator):
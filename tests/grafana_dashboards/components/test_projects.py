@@ -13,6 +13,7 @@
 # limitations under the License.
 from unittest import mock
 
+from grafana_dashboards.components.base import ComponentIndex
 from grafana_dashboards.components.projects import Project
 
 __author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
@@ -20,6 +21,7 @@ __author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
 
 def test_project():
     with mock.patch('grafana_dashboards.components.base.ComponentRegistry') as registry:
+        registry.index = ComponentIndex()
         data = {
             'project': {
                 'dashboards': [
@@ -63,6 +65,7 @@ def test_project():
         contexts = [context for context in project.get_contexts()]
         assert contexts is not None
         assert len(contexts) == 4
+        assert project.count_contexts() == 4
         for context in contexts:
             to_expand = '{single}-{list}-{dict}-{dict-value}-{missing}-{wrapped}-{double-wrapped}'
             expanded = context.expand_placeholders(to_expand)
@@ -0,0 +1,64 @@
+# Copyright 2015-2025 grafana-dashboard-builder contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pickle
+from pathlib import Path
+
+import pytest
+
+from grafana_dashboards import bundle, errors
+from grafana_dashboards.parser import DefinitionParser
+
+__author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
+
+_samples = sorted(str(path) for path in (Path(__file__).resolve().parent.parent.parent / 'samples').glob('*.yaml')
+                  if path.name not in ('config.yaml', 'env.yaml'))
+
+
+def _render(projects):
+    return {(project.name, dashboard.name): [dashboard.gen_json(context) for context in project.get_contexts()]
+            for project in projects for dashboard in project.get_dashboards()}
+
+
+def test_bundle_renders_same_as_definitions(tmp_path):
+    bundle_path = tmp_path / 'definitions.bundle'
+    DefinitionParser().compile_bundle(_samples, bundle_path)
+
+    assert _render(DefinitionParser().load_bundle(bundle_path)) == _render(DefinitionParser().load_projects(_samples))
+    assert list(tmp_path.iterdir()) == [bundle_path]
+
+
+def test_bundle_selects_projects(tmp_path):
+    bundle_path = tmp_path / 'definitions.bundle'
+    DefinitionParser().compile_bundle(_samples, bundle_path)
+
+    projects = DefinitionParser().load_bundle(bundle_path, ['Example project'])
+
+    assert [project.name for project in projects] == ['Example project']
+
+
+def test_read_bundle_rejects_other_files(tmp_path):
+    path = tmp_path / 'definitions.yaml'
+    path.write_text('- name: dashboard\n')
+
+    with pytest.raises(errors.BundleFormatError, match='not a definition bundle'):
+        bundle.read_bundle(path)
+
+
+def test_read_bundle_rejects_other_version(tmp_path):
+    path = tmp_path / 'definitions.bundle'
+    # noinspection PyProtectedMember
+    path.write_bytes(bundle._MAGIC + pickle.dumps((bundle._VERSION + 1, {})))
+
+    with pytest.raises(errors.BundleFormatError, match='compile it again'):
+        bundle.read_bundle(path)
@@ -0,0 +1,88 @@
+# Copyright 2015-2025 grafana-dashboard-builder contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from unittest.mock import patch
+
+from grafana_dashboards import cache
+from grafana_dashboards.cache import ParseCache
+from grafana_dashboards.gdbyaml import FastGDBLoader
+
+__author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
+
+
+def _write_definitions(tmp_path):
+    (tmp_path / 'included.yaml').write_text('value: 1\n')
+    definitions = tmp_path / 'definitions.yaml'
+    definitions.write_text('- project:\n    included: !include included.yaml\n')
+    return str(definitions)
+
+
+def test_cache_hit(tmp_path):
+    path = _write_definitions(tmp_path)
+    parse_cache = ParseCache(tmp_path / 'cache')
+
+    documents = parse_cache.load_all(path, FastGDBLoader)
+
+    assert documents == [[{'project': {'included': {'value': 1}}}]]
+    with patch.object(cache, 'load_all_with_includes') as load_mock:
+        assert ParseCache(tmp_path / 'cache').load_all(path, FastGDBLoader) == documents
+    load_mock.assert_not_called()
+
+
+def test_cache_invalidated_by_include_change(tmp_path):
+    path = _write_definitions(tmp_path)
+    parse_cache = ParseCache(tmp_path / 'cache')
+    parse_cache.load_all(path, FastGDBLoader)
+
+    (tmp_path / 'included.yaml').write_text('value: 2\n')
+
+    assert parse_cache.load_all(path, FastGDBLoader) == [[{'project': {'included': {'value': 2}}}]]
+
+
+def test_cache_invalidated_by_format_version(tmp_path):
+    path = _write_definitions(tmp_path)
+    ParseCache(tmp_path / 'cache').load_all(path, FastGDBLoader)
+
+    with patch.object(cache, '_FORMAT_VERSION', cache._FORMAT_VERSION + 1), \
+            patch.object(cache, 'load_all_with_includes', wraps=cache.load_all_with_includes) as load_mock:
+        assert ParseCache(tmp_path / 'cache').load_all(path, FastGDBLoader) == [[{'project': {'included': {'value': 1}}}]]
+    load_mock.assert_called_once()
+
+
+def test_cache_ignores_unreadable_entry(tmp_path):
+    path = _write_definitions(tmp_path)
+    parse_cache = ParseCache(tmp_path / 'cache')
+    parse_cache.load_all(path, FastGDBLoader)
+    for entry in (tmp_path / 'cache').glob('*.pickle'):
+        entry.write_bytes(b'garbage')
+
+    assert parse_cache.load_all(path, FastGDBLoader) == [[{'project': {'included': {'value': 1}}}]]
+
+
+def test_cache_removes_temporary_file_of_failed_write(tmp_path):
+    path = _write_definitions(tmp_path)
+
+    with patch.object(cache.pickle, 'dump', side_effect=OSError('No space left on device')):
+        assert ParseCache(tmp_path / 'cache').load_all(path, FastGDBLoader) == [[{'project': {'included': {'value': 1}}}]]
+
+    assert list((tmp_path / 'cache').iterdir()) == []
+
+
+def test_cache_evicts_entries_over_max_size(tmp_path):
+    parse_cache = ParseCache(tmp_path / 'cache', max_size=1)
+    for i in range(3):
+        path = tmp_path / f'definitions-{i}.yaml'
+        path.write_text(f'- value: {i}\n')
+        assert parse_cache.load_all(str(path), FastGDBLoader) == [[{'value': i}]]
+
+    assert list((tmp_path / 'cache').glob('*.pickle')) == []
@@ -12,7 +12,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 from pathlib import Path
-from unittest.mock import patch
 
 from grafana_dashboards import cli
 from grafana_dashboards.config import Config
@@ -40,12 +39,24 @@ def test_initialize_exporters():
     assert exporters[0].kwargs == {'other': True}
 
 
-# noinspection PyUnusedLocal
-@patch('os.walk', return_value=[('/path', ['dir1', 'dir2'], ['file1', 'file2'])])
-@patch('pathlib.Path.is_dir', return_value=True)
-def test_process_paths(isdir, walk):
+def test_process_paths(tmp_path):
+    for name in ['b.yaml', 'a.yml', 'notes.txt', '.a.yaml.swp', '.#b.yaml', 'sub/c.yaml', 'sub/fixture.json', '.git/d.yaml', 'vendor/e.yaml']:
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text('')
+    explicit = str(tmp_path / 'notes.txt')
+
+    # noinspection PyProtectedMember
+    paths = cli._process_paths([str(tmp_path), explicit])
+
+    assert paths == [str(tmp_path / name) for name in ['a.yml', 'b.yaml', 'notes.txt', 'sub/c.yaml', 'vendor/e.yaml']]
+
+
+def test_process_paths_include_exclude(tmp_path):
+    for name in ['a.yaml', 'sub/b.yaml', 'sub/c.json', 'vendor/d.yaml']:
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text('')
+
     # noinspection PyProtectedMember
-    paths = cli._process_paths(['/path'])
+    paths = cli._process_paths([str(tmp_path)], include=['*.yaml', 'sub/*.json'], exclude=['vendor', 'a.*'])
 
-    # noinspection PySetFunctionToLiteral
-    assert paths == {'/path/file1', '/path/file2'}
+    assert paths == [str(tmp_path / 'sub' / 'b.yaml'), str(tmp_path / 'sub' / 'c.json')]
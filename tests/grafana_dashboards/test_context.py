@@ -11,7 +11,14 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from grafana_dashboards.context import Context, DictDefaultingToPlaceholder
+import itertools
+import pickle
+
+import pytest
+
+from grafana_dashboards import errors
+from grafana_dashboards.context import Context, ContextExpander, DictDefaultingToPlaceholder, LayeredContext, StaticDict, StaticList
+from grafana_dashboards.context import compile_template, freeze
 
 __author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
 
@@ -109,3 +116,180 @@ def test_context_expands_dict_value():
     to_expand = {'single': '{single}', 'expanded-dict': '{expanded-dict}', 'dict-value': '{dict-value}'}
     assert contexts[0].expand_placeholders(to_expand) == expected0
     assert contexts[1].expand_placeholders(to_expand) == expected1
+
+
+def test_compile_template():
+    template = compile_template('{{escaped}}-{first}-{second}')
+
+    assert template.fields == ['first', 'second']
+    assert template.render(['1', '2']) == '{escaped}-1-2'
+    assert compile_template('{{escaped}}-{first}-{second}') is template
+    assert compile_template('no {{placeholders}}').literal == 'no {placeholders}'
+
+
+def test_context_expands_compiled_templates():
+    context = Context({'single': 'first', 'nested': '{single}', 'list': ['list0']})
+    to_expand = [
+        '{single}-{missing}',
+        '{nested}-{single}',
+        '{{escaped}}-{single}',
+        '{list}',
+        '{single:>6}',
+        'sum(x{{a="{single}"}})'
+    ]
+    expected = [
+        'first-{missing}',
+        'first-first',
+        '{escaped}-first',
+        ['list0'],
+        ' first',
+        'sum(x{a="first"})'
+    ]
+    assert context.expand_placeholders(to_expand) == expected
+
+
+def test_context_resolves_placeholders_once():
+    context = Context({
+        'dashboard-prefix': '{env}-{component}',
+        'title': '{dashboard-prefix} overview',
+        'env': 'prod',
+        'component': 'frontend',
+        'unresolved': '{unresolved}'
+    })
+
+    assert context.expand_placeholders('{title}') == 'prod-frontend overview'
+    assert context.expand_placeholders('{unresolved}-{title}') == '{unresolved}-prod-frontend overview'
+
+
+def test_context_self_reference():
+    with pytest.raises(errors.CyclicPlaceholderError) as e:
+        Context({'single': '{single}-suffix'})
+    assert 'single -> single' in str(e.value)
+
+
+def test_context_cyclic_reference():
+    with pytest.raises(errors.CyclicPlaceholderError) as e:
+        Context({'first': '{second}', 'second': 'x-{third}', 'third': '{first}'})
+    assert 'first -> second -> third -> first' in str(e.value)
+
+
+def test_layered_context():
+    parent = DictDefaultingToPlaceholder({'shared': 'parent', 'overridden': 'parent'})
+    layered = LayeredContext({'overridden': 'child'}, parent)
+
+    assert layered['shared'] == 'parent'
+    assert layered['overridden'] == 'child'
+    assert layered['missing'] == '{missing}'
+    assert 'shared' in layered
+    assert 'missing' not in layered
+
+
+def test_context_layers_only_varying_values():
+    data = {
+        'single': 'first',
+        'prefix': '{expanded-list}-{single}',
+        'overridden': '{overridden}-cyclic',
+        'expanded-list': ['list0', 'list1'],
+        'expanded-dict': [{'dict0': {'overridden': 'value0'}}, {'dict1': {'overridden': 'value1'}}]
+    }
+    contexts = [context for context in Context.create_context(data, keys_to_expand=('expanded-list', 'expanded-dict'))]
+    assert len(contexts) == 4
+    to_expand = '{single} {prefix} {overridden}'
+    assert [context.expand_placeholders(to_expand) for context in contexts] == [
+        'first list0-first value0',
+        'first list0-first value1',
+        'first list1-first value0',
+        'first list1-first value1'
+    ]
+
+
+def test_context_count():
+    data = {
+        'single': 'value',
+        'expanded-list': ['list0', 'list1', 'list2'],
+        'expanded-dict': [{'dict0': {'nested': ['nested0', 'nested1']}}, 'dict1'],
+        'not-expanded': ['a', 'b']
+    }
+    keys = ('expanded-list', 'expanded-dict', 'nested')
+    assert Context.count_contexts(data, keys) == 9
+    assert len(list(Context.create_context(data, keys))) == 9
+
+
+def test_context_expansion_is_lazy():
+    data = {'first': list(range(1000)), 'second': list(range(1000)), 'third': list(range(1000))}
+    keys = ('first', 'second', 'third')
+    assert Context.count_contexts(data, keys) == 1000 ** 3
+
+    contexts = Context.create_context(data, keys)
+    assert [context.expand_placeholders('{first}-{second}-{third}') for context in itertools.islice(contexts, 3)] == [
+        '0-0-0',
+        '0-0-1',
+        '0-0-2'
+    ]
+
+
+def test_context_combinations():
+    data = {
+        'single': 'value',
+        'first': ['first0', 'first1', 'first2'],
+        'second': [{'second0': {'nested': ['nested0', 'nested1']}}, 'second1']
+    }
+    (shared, combinations) = ContextExpander(('first', 'second', 'nested')).create_layers(data)
+    assert shared == {'single': 'value'}
+    assert combinations.radices == (3, 3)
+    assert combinations.count == 9
+    assert combinations.decode(5) == (1, 2)
+    assert combinations.encode((1, 2)) == 5
+    assert combinations[5] == {'first': 'first1', 'second': 'second1'}
+    assert combinations[4] == {'first': 'first1', 'second': 'second0', 'nested': 'nested1'}
+    assert list(combinations.iterate(4, 6)) == [combinations[4], combinations[5]]
+    assert list(combinations)[4:] == list(combinations.iterate(4))
+    with pytest.raises(IndexError):
+        combinations.decode(9)
+    with pytest.raises(IndexError):
+        combinations.encode((3, 0))
+
+
+def test_context_start_stop():
+    data = {'first': list(range(1000)), 'second': list(range(1000)), 'third': list(range(1000))}
+    keys = ('first', 'second', 'third')
+
+    contexts = Context.create_context(data, keys, start=123456789, stop=123456791)
+    assert [context.expand_placeholders('{first}-{second}-{third}') for context in contexts] == [
+        '123-456-789',
+        '123-456-790'
+    ]
+
+
+def test_freeze():
+    data = freeze({
+        'static-dict': {'key': 'value', 'list': [1, 2, {'nested': True}]},
+        'static-list': ['value', 1, None],
+        'dynamic-list': ['static', '{placeholder}'],
+        'escaped': {'value': '{{'},
+        'placeholder': '{placeholder}'
+    })
+
+    assert not isinstance(data, StaticDict)
+    assert isinstance(data['static-dict'], StaticDict)
+    assert isinstance(data['static-dict']['list'], StaticList)
+    assert isinstance(data['static-list'], StaticList)
+    assert not isinstance(data['dynamic-list'], StaticList)
+    assert not isinstance(data['escaped'], StaticDict)
+
+    expanded = Context({'placeholder': 'expanded'}).expand_placeholders(data)
+    assert expanded == {
+        'static-dict': {'key': 'value', 'list': [1, 2, {'nested': True}]},
+        'static-list': ['value', 1, None],
+        'dynamic-list': ['static', 'expanded'],
+        'escaped': {'value': '{'},
+        'placeholder': 'expanded'
+    }
+    assert expanded['static-dict'] is data['static-dict']
+    assert expanded['static-list'] is data['static-list']
+
+    with pytest.raises(TypeError):
+        data['dynamic-list'].append('value')
+    with pytest.raises(TypeError):
+        data['static-dict']['key'] = 'modified'
+    assert pickle.loads(pickle.dumps(data)) == data
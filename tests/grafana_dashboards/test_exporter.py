@@ -11,14 +11,22 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import json
+import time
+from pathlib import Path
 from unittest.mock import MagicMock, patch
 
 import pytest
 
+from grafana_dashboards import errors
 from grafana_dashboards.exporter import FileExporter, ProjectProcessor
+from grafana_dashboards.parser import DefinitionParser
 
 __author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
 
+_samples = sorted(str(path) for path in (Path(__file__).resolve().parent.parent.parent / 'samples').glob('*.yaml')
+                  if path.name not in ('config.yaml', 'env.yaml'))
+
 
 def test_project_processor():
     dashboard_processor = MagicMock()
@@ -40,19 +48,212 @@ def test_project_processor():
                                                                   dashboard.gen_json())
 
 
-@patch('grafana_dashboards.exporter.open', create=True)
-@patch('json.dump')
-@patch('pathlib.Path.mkdir', return_value=True)
-@patch('pathlib.Path.is_dir', return_value=True)
-@patch('pathlib.Path.exists', return_value=True)
-def test_file_exporter(patch_exists, path_isdir, makedirs, json_dump, mock_file):
-    exporter = FileExporter('output_folder')
+def test_project_processor_context_limit():
+    dashboard_processor = MagicMock()
+    processor = ProjectProcessor([dashboard_processor], max_contexts=10)
+    project = MagicMock()
+    project.count_contexts.return_value = 11
+    project.get_dashboards.return_value = [MagicMock()]
+
+    # noinspection PyTypeChecker
+    with pytest.raises(errors.ContextLimitExceededError):
+        processor.process_projects([project])
+
+    project.get_contexts.assert_not_called()
+    dashboard_processor.process_dashboard.assert_not_called()
+
+
+def test_project_processor_parallel_keeps_order():
+    serial_processor = MagicMock()
+    parallel_processor = MagicMock()
+
+    ProjectProcessor([serial_processor]).process_projects(DefinitionParser().load_projects(_samples), {'source': 'test'})
+    ProjectProcessor([parallel_processor], jobs=2).process_projects(DefinitionParser().load_projects(_samples), {'source': 'test'})
+
+    assert len(serial_processor.process_dashboard.call_args_list) > 10
+    assert parallel_processor.process_dashboard.call_args_list == serial_processor.process_dashboard.call_args_list
+
+
+class _InlineExecutor:
+    """Renders units in this process when submitted, tracks units whose results were not taken yet."""
+
+    def __init__(self, max_workers, mp_context, initializer, initargs):
+        initializer(*initargs)
+        self.outstanding = self.max_outstanding = 0
+
+    def submit(self, fn, *args):
+        self.outstanding += 1
+        self.max_outstanding = max(self.max_outstanding, self.outstanding)
+        future = MagicMock()
+        result = fn(*args)
+        future.result.side_effect = lambda: setattr(self, 'outstanding', self.outstanding - 1) or result
+        return future
+
+    def shutdown(self, cancel_futures):
+        pass
+
+
+def test_project_processor_parallel_renders_bounded_window():
+    executors = []
+    serial_processor = MagicMock()
+    parallel_processor = MagicMock()
+
+    ProjectProcessor([serial_processor]).process_projects(DefinitionParser().load_projects(_samples), {'source': 'test'})
+    with patch('grafana_dashboards.exporter.ProcessPoolExecutor', side_effect=lambda **kwargs: executors.append(_InlineExecutor(**kwargs)) or executors[-1]):
+        ProjectProcessor([parallel_processor], jobs=2).process_projects(DefinitionParser().load_projects(_samples), {'source': 'test'})
+
+    assert parallel_processor.process_dashboard.call_args_list == serial_processor.process_dashboard.call_args_list
+    assert [executor.outstanding for executor in executors] == [0]
+    assert executors[0].max_outstanding == 4
+
+
+def test_project_processor_parallel_error(tmp_path):
+    path = tmp_path / 'definitions.yaml'
+    path.write_text('- name: project\n'
+                    '  project:\n'
+                    "    dashboards: ['dashboard-{env}']\n"
+                    '    env: [dev, prod]\n'
+                    "- name: 'dashboard-{env}'\n"
+                    '  dashboard:\n'
+                    '    rows: [missing-row]\n')
+    dashboard_processor = MagicMock()
+
+    with pytest.raises(errors.UnregisteredComponentError):
+        ProjectProcessor([dashboard_processor], jobs=2).process_projects(DefinitionParser().load_projects([str(path)]))
+
+    dashboard_processor.process_dashboard.assert_not_called()
+
+
+def _create_project(context_count):
+    project = MagicMock()
+    project.name = 'project'
+    project.count_contexts.return_value = context_count
+    project.get_contexts.return_value = [MagicMock(**{'expand_placeholders.return_value': f'dashboard-{i}'}) for i in range(context_count)]
+    dashboard = MagicMock()
+    dashboard.gen_json.side_effect = lambda context: {'title': context.expand_placeholders()}
+    project.get_dashboards.return_value = [dashboard]
+    return project
+
+
+def test_project_processor_pipeline_keeps_order():
+    exported = []
+    slow_processor = MagicMock(**{'process_dashboard.side_effect': lambda *args: time.sleep(0.001) or exported.append(args)})
+
+    ProjectProcessor([slow_processor], export_queue_size=2).process_projects([_create_project(20)])
+
+    assert exported == [('project', f'dashboard-{i}', {'title': f'dashboard-{i}'}) for i in range(20)]
+
+
+def test_project_processor_pipeline_exporter_error():
+    project = _create_project(100)
+    failing_processor = MagicMock(**{'process_dashboard.side_effect': [None, ValueError('testing')]})
+    dashboard_processor = MagicMock()
+
+    with pytest.raises(ValueError, match='testing'):
+        ProjectProcessor([failing_processor, dashboard_processor], export_queue_size=2).process_projects([project])
+
+    [dashboard] = project.get_dashboards()
+    assert dashboard.gen_json.call_count < 100
+    assert dashboard_processor.process_dashboard.call_count == dashboard.gen_json.call_count
+
+
+def test_project_processor_pipeline_render_error():
+    project = _create_project(5)
+    [dashboard] = project.get_dashboards()
+    dashboard.gen_json.side_effect = [{}, {}, errors.UnregisteredComponentError('testing')]
+    dashboard_processor = MagicMock()
+
+    with pytest.raises(errors.UnregisteredComponentError):
+        ProjectProcessor([dashboard_processor]).process_projects([project])
+
+    assert dashboard_processor.process_dashboard.call_count == 2
+
+
+def test_file_exporter(tmp_path):
+    exporter = FileExporter(str(tmp_path))
 
     dashboard_data = {'some_key': 'some_value'}
     exporter.process_dashboard('project_name', 'dashboard_name', dashboard_data)
+    exporter.close()
+
+    assert json.loads((tmp_path / 'project_name' / 'dashboard_name.json').read_text()) == dashboard_data
+    assert sorted(path.name for path in tmp_path.glob('**/.*')) == ['.grafana-dashboard-builder.manifest']
+
+
+def _export_files(output_folder, dashboards, completed=True):
+    exporter = FileExporter(str(output_folder), remove_stale=True)
+    for (name, data) in dashboards.items():
+        exporter.process_dashboard('project', name, data)
+    exporter.close(completed)
+    return {path.name: path.stat().st_mtime_ns for path in output_folder.glob('project/*.json')}
+
+
+def test_file_exporter_writes_changed_files_only(tmp_path):
+    dashboards = {'first': {'title': 'first'}, 'second': {'title': 'second'}}
+    first_run = _export_files(tmp_path, dashboards)
+    time.sleep(0.01)
+
+    dashboards['second'] = {'title': 'changed'}
+    second_run = _export_files(tmp_path, dashboards)
+
+    assert second_run['first.json'] == first_run['first.json']
+    assert second_run['second.json'] != first_run['second.json']
+    assert json.loads((tmp_path / 'project' / 'second.json').read_text()) == {'title': 'changed'}
+
+
+def test_file_exporter_rewrites_modified_files(tmp_path):
+    _export_files(tmp_path, {'first': {'title': 'first'}})
+    (tmp_path / 'project' / 'first.json').write_text('{}')
+
+    _export_files(tmp_path, {'first': {'title': 'first'}})
+
+    assert json.loads((tmp_path / 'project' / 'first.json').read_text()) == {'title': 'first'}
+
+
+def test_file_exporter_removes_stale_files_after_completed_run(tmp_path):
+    (tmp_path / 'project').mkdir()
+    (tmp_path / 'project' / 'foreign.json').write_text('{}')
+    _export_files(tmp_path, {'first': {'title': 'first'}, 'second': {'title': 'second'}})
+
+    assert set(_export_files(tmp_path, {'first': {'title': 'first'}}, completed=False)) == {'first.json', 'second.json', 'foreign.json'}
+    assert set(_export_files(tmp_path, {'first': {'title': 'first'}})) == {'first.json', 'foreign.json'}
+
+
+@pytest.mark.parametrize('first_render', [{}, errors.UnregisteredComponentError('testing')])
+def test_project_processor_pipeline_closes_incomplete_run(first_render):
+    project = _create_project(3)
+    [dashboard] = project.get_dashboards()
+    dashboard.gen_json.side_effect = [first_render, errors.UnregisteredComponentError('testing')]
+    dashboard_processor = MagicMock()
+
+    with pytest.raises(errors.UnregisteredComponentError):
+        ProjectProcessor([dashboard_processor]).process_projects([project])
+
+    dashboard_processor.close.assert_called_once_with(False)
+
+
+def test_file_exporter_keeps_files_of_projects_not_selected(tmp_path):
+    path = tmp_path / 'definitions.yaml'
+    path.write_text('- name: p1\n  project:\n    dashboards: [d1]\n'
+                    '- name: p2\n  project:\n    dashboards: [d2]\n'
+                    '- name: d1\n  dashboard:\n    title: d1\n'
+                    '- name: d2\n  dashboard:\n    title: d2\n')
+    output = tmp_path / 'out'
+
+    for project_names in [None, ['p1']]:
+        projects = DefinitionParser().load_projects([str(path)], project_names)
+        ProjectProcessor([FileExporter(str(output), remove_stale=True)]).process_projects(projects)
+
+    assert sorted(path.relative_to(output).as_posix() for path in output.glob('*/*.json')) == ['p1/d1.json', 'p2/d2.json']
+
+
+def test_project_processor_pipeline_closes_exporters_without_dashboards():
+    dashboard_processor = MagicMock()
+
+    ProjectProcessor([dashboard_processor]).process_projects([_create_project(0)])
 
-    json_dump.assert_called_once_with(dashboard_data, mock_file().__enter__(), sort_keys=True, indent=2,
-                                      separators=(',', ': '))
+    dashboard_processor.process_dashboard.assert_not_called()
+    dashboard_processor.close.assert_called_once_with(True)
 
 
 @patch('pathlib.Path.mkdir', side_effect=[True, OSError('testing')])
@@ -0,0 +1,129 @@
+# Copyright 2015-2025 grafana-dashboard-builder contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import functools
+import pickle
+from pathlib import Path
+
+import pytest
+import yaml
+
+from grafana_dashboards import errors, gdbyaml
+from grafana_dashboards.context import freeze
+
+__author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
+
+_root = Path(__file__).resolve().parent.parent.parent
+_definitions = sorted([*(_root / 'samples').glob('*.yaml'),
+                       *(_root / 'tests' / 'grafana_dashboards' / 'components').glob('*/*.yaml')])
+
+
+def test_loader_includes_relative_to_file():
+    with open(_root / 'samples' / 'project.yaml') as fp:
+        documents = list(yaml.load_all(fp, Loader=gdbyaml.FastGDBLoader))
+
+    assert documents[0][0]['project']['env'] == [{'testing': {'nodes': ['node1', 'node2']}}, {'production': {'nodes': 'node3'}}]
+
+
+@pytest.mark.skipif(not yaml.__with_libyaml__, reason='libyaml is not available')
+@pytest.mark.parametrize('path', _definitions, ids=lambda path: str(path.relative_to(_root)))
+def test_libyaml_loader_parity(path):
+    assert gdbyaml.FastGDBLoader is gdbyaml.GDBCLoader
+    with open(path) as fp:
+        expected = list(yaml.load_all(fp, Loader=gdbyaml.GDBLoader))
+    with open(path) as fp:
+        assert list(yaml.load_all(fp, Loader=gdbyaml.GDBCLoader)) == expected
+
+
+def test_include_resolved_once(tmp_path):
+    (tmp_path / 'env.yaml').write_text('nodes: [node1, node2]\n')
+    (tmp_path / 'definitions.yaml').write_text('- first: !include env.yaml\n  second: !include env.yaml\n- third: !include ./env.yaml\n')
+    includes = gdbyaml.IncludeResolver()
+
+    with open(tmp_path / 'definitions.yaml') as fp:
+        (documents, included_files) = gdbyaml.load_all_with_includes(fp, gdbyaml.FastGDBLoader, includes)
+
+    [first, second, third] = [value for item in documents[0] for value in item.values()]
+    assert first == {'nodes': ['node1', 'node2']}
+    assert first is second is third
+    with pytest.raises(TypeError):
+        first['nodes'] = []
+    assert included_files == [tmp_path / 'env.yaml'] * 3
+    assert includes.counts == {tmp_path / 'env.yaml': 3}
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_include_relative_to_symlink(tmp_path, lazy):
+    (tmp_path / 'shared').mkdir()
+    (tmp_path / 'shared' / 'include.yaml').write_text('nested: !include value.yaml\n')
+    (tmp_path / 'shared' / 'value.yaml').write_text('value: from-shared\n')
+    (tmp_path / 'project').mkdir()
+    (tmp_path / 'project' / 'include.yaml').symlink_to(tmp_path / 'shared' / 'include.yaml')
+    (tmp_path / 'project' / 'value.yaml').write_text('value: from-project\n')
+    (tmp_path / 'project' / 'definitions.yaml').write_text('included: !include include.yaml\n')
+
+    with open(tmp_path / 'project' / 'definitions.yaml') as fp:
+        [documents] = gdbyaml.load_all_with_includes(fp, gdbyaml.FastGDBLoader, gdbyaml.IncludeResolver(lazy))[0]
+
+    assert freeze(documents) == {'included': {'nested': {'value': 'from-project'}}}
+
+
+def test_include_cycle(tmp_path):
+    (tmp_path / 'a.yaml').write_text('b: !include b.yaml\n')
+    (tmp_path / 'b.yaml').write_text('a: !include a.yaml\n')
+
+    with open(tmp_path / 'a.yaml') as fp, pytest.raises(errors.IncludeCycleError, match='b.yaml -> .*a.yaml -> .*b.yaml'):
+        yaml.load(fp, Loader=gdbyaml.FastGDBLoader)
+
+
+def test_lazy_include_read_when_frozen(tmp_path):
+    (tmp_path / 'definitions.yaml').write_text('- first: !include env.yaml\n  second: !include env.yaml\n')
+    includes = gdbyaml.IncludeResolver(lazy=True)
+
+    with open(tmp_path / 'definitions.yaml') as fp:
+        [document] = yaml.load_all(fp, Loader=functools.partial(gdbyaml.FastGDBLoader, includes=includes))
+    (tmp_path / 'env.yaml').write_text('nodes: [node1, node2]\n')
+
+    assert isinstance(document[0]['first'], gdbyaml.LazyInclude)
+    frozen = freeze(document)
+    assert frozen == [{'first': {'nodes': ['node1', 'node2']}, 'second': {'nodes': ['node1', 'node2']}}]
+    assert frozen[0]['first'] is frozen[0]['second']
+    assert includes.counts == {tmp_path / 'env.yaml': 2}
+
+
+def test_lazy_include_pickle(tmp_path):
+    (tmp_path / 'env.yaml').write_text('nodes: [node1, node2]\n')
+    lazy_include = gdbyaml.LazyInclude(tmp_path / 'env.yaml', gdbyaml.FastGDBLoader)
+
+    assert freeze(pickle.loads(pickle.dumps(lazy_include))) == {'nodes': ['node1', 'node2']}
+
+
+def test_lazy_include_cycle(tmp_path):
+    (tmp_path / 'a.yaml').write_text('b: !include b.yaml\n')
+    (tmp_path / 'b.yaml').write_text('a: !include a.yaml\n')
+    lazy_include = gdbyaml.LazyInclude(tmp_path / 'a.yaml', gdbyaml.FastGDBLoader)
+
+    with pytest.raises(errors.IncludeCycleError, match='Cyclic include'):
+        freeze(lazy_include)
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+@pytest.mark.parametrize(('content', 'expected'), [(b'line 1\r\nline 2\r\n', 'line 1\nline 2\n'), (b'', '')])
+def test_text_include(tmp_path, lazy, content, expected):
+    (tmp_path / 'text.md').write_bytes(content)
+    (tmp_path / 'definitions.yaml').write_text('content: !include text.md\n')
+
+    with open(tmp_path / 'definitions.yaml') as fp:
+        (documents, _) = gdbyaml.load_all_with_includes(fp, gdbyaml.FastGDBLoader, gdbyaml.IncludeResolver(lazy))
+
+    assert freeze(documents) == [{'content': expected}]
@@ -0,0 +1,120 @@
+# Copyright 2015-2025 grafana-dashboard-builder contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from collections import Counter
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+import yaml
+
+from grafana_dashboards import errors, gdbyaml, parser
+from grafana_dashboards.cache import ParseCache
+from grafana_dashboards.parser import DefinitionParser
+
+__author__ = 'Jakub Plichta <jakub.plichta@gmail.com>'
+
+_samples = sorted(str(path) for path in (Path(__file__).resolve().parent.parent.parent / 'samples').glob('*.yaml'))
+
+
+def test_parallel_parse_matches_serial():
+    serial_counts: Counter[Path] = Counter()
+    parallel_counts: Counter[Path] = Counter()
+
+    # noinspection PyProtectedMember
+    serial = list(DefinitionParser()._parse_all(_samples, serial_counts))
+    # noinspection PyProtectedMember
+    parallel = list(DefinitionParser(jobs=2)._parse_all(_samples, parallel_counts))
+
+    assert parallel == serial
+    assert parallel_counts == serial_counts
+    assert sum(serial_counts.values()) > 0
+
+
+def test_parallel_parse_reports_first_duplicate(tmp_path):
+    paths = []
+    for i in range(4):
+        path = tmp_path / f'definitions-{i}.yaml'
+        path.write_text(f'- name: dashboard-{i // 2}\n  dashboard:\n    title: {i}\n')
+        paths.append(str(path))
+
+    with pytest.raises(errors.DuplicateKeyError, match="'dashboard-0'"):
+        DefinitionParser(jobs=2).load_projects(paths)
+
+
+def test_parallel_parse_propagates_parse_error(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f'definitions-{i}.yaml'
+        path.write_text('- [' if i == 1 else f'- name: dashboard-{i}\n  dashboard: {{}}\n')
+        paths.append(str(path))
+
+    with pytest.raises(yaml.YAMLError, match='definitions-1.yaml'):
+        DefinitionParser(jobs=2).load_projects(paths)
+
+
+def test_worker_parses_shared_include_once(tmp_path):
+    (tmp_path / 'shared.yaml').write_text('title: Shared\n')
+    paths = []
+    for i in range(3):
+        path = tmp_path / f'definitions-{i}.yaml'
+        path.write_text(f'- name: dashboard-{i}\n  dashboard: !include shared.yaml\n')
+        paths.append(str(path))
+
+    # noinspection PyProtectedMember
+    parser._initialize_worker(None, False)
+    # noinspection PyProtectedMember
+    with patch.object(gdbyaml, '_load_include', wraps=gdbyaml._load_include) as load_include:
+        # noinspection PyProtectedMember
+        results = [parser._parse(path) for path in paths]
+
+    assert load_include.call_count == 1
+    assert [documents for (documents, _) in results] == [[[{'name': f'dashboard-{i}', 'dashboard': {'title': 'Shared'}}]] for i in range(3)]
+    assert [counts for (_, counts) in results] == [Counter({tmp_path / 'shared.yaml': 1})] * 3
+
+
+def test_lazy_includes_of_unused_definitions_are_not_read(tmp_path):
+    path = tmp_path / 'definitions.yaml'
+    path.write_text('- name: project\n'
+                    '  project:\n'
+                    '    dashboards: [used]\n'
+                    '- name: used\n'
+                    '  dashboard: !include used.yaml\n'
+                    '- name: unused\n'
+                    '  dashboard: !include missing.yaml\n')
+    (tmp_path / 'used.yaml').write_text('title: Used\n')
+
+    [project] = DefinitionParser(lazy_includes=True).load_projects([str(path)], ['project'])
+
+    [dashboard] = project.get_dashboards()
+    assert dashboard.data == {'title': 'Used'}
+
+
+def test_lazy_includes_with_parse_cache(tmp_path):
+    path = tmp_path / 'definitions.yaml'
+    path.write_text('- name: project\n'
+                    '  project:\n'
+                    '    dashboards: [used]\n'
+                    '- name: used\n'
+                    '  dashboard: !include used.yaml\n'
+                    '- name: unused\n'
+                    '  dashboard: !include missing.yaml\n')
+    (tmp_path / 'used.yaml').write_text('title: Used\n')
+
+    for title in ['Used', 'Changed']:
+        (tmp_path / 'used.yaml').write_text(f'title: {title}\n')
+        definition_parser = DefinitionParser(ParseCache(tmp_path / 'cache'), lazy_includes=True)
+        [project] = definition_parser.load_projects([str(path)], ['project'])
+
+        [dashboard] = project.get_dashboards()
+        assert dashboard.data == {'title': title}